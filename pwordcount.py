@@ -1,514 +1,3751 @@
 import sys
+import bz2
+import fnmatch
+import gzip
+import hashlib
+import heapq
+import json
+import lzma
+import math
+import mmap
 import multiprocessing
+import multiprocessing.connection
+import multiprocessing.pool
 import os
+import pickle
+import platform
+import random
+import re
+import resource
+import shlex
+import shutil
+import stat
+import string
 import subprocess
-from collections import Counter
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, deque
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import accumulate, islice
+from operator import itemgetter
+
+# Size of the blocks read at once when scanning a file
+BLOCK_SIZE = 1024 * 1024
+# ASCII whitespace bytes, the separators between words
+WHITESPACE_BYTES = b" \t\n\r\x0b\x0c"
+# Matches a single ASCII whitespace byte
+WHITESPACE = re.compile(rb"\s")
+# Translation table marking whitespace bytes as b" " and every other byte as b"x",
+# so that words can be counted as the number of b" x" transitions
+WORD_MARKS = bytes(32 if byte in WHITESPACE_BYTES else 120 for byte in range(256))
+
+# Tokenizers of --tokenizer: whitespace-separated words, Unicode words, or the matches of --pattern
+TOKENIZERS = ("whitespace", "unicode", "regex")
+# Case normalizations of --case: lowercase, or case folding (e.g. "Straße" and "STRASSE" are the same word)
+CASES = ("lower", "fold")
+# Words of the unicode tokenizer: runs of letters, digits and underscores, joined by apostrophes as in "don't";
+# the ASCII version is used on ASCII blocks, where it matches the same words without decoding them
+UNICODE_WORD = re.compile(r"\w+(?:['\u2019]\w+)*")
+ASCII_WORD = re.compile(rb"\w+(?:'\w+)*")
+# Punctuation removed from the start and end of every token by --strip-punctuation: anything but word characters,
+# as ASCII bytes stripped from ASCII tokens and as a regular expression for the others
+ASCII_PUNCTUATION = bytes(byte for byte in range(128)
+                          if not (chr(byte).isalnum() or chr(byte) == "_") and byte not in WHITESPACE_BYTES)
+UNICODE_PUNCTUATION = re.compile(r"^\W+|\W+$")
+
+# Number of partial results above which divide_one_file merges them in the workers, in a tree
+TREE_REDUCTION_THRESHOLD = 4
+
+# Size above which divide_between divides a file into byte ranges of about this size,
+# so that a single big file is shared between several workers
+SPLIT_THRESHOLD = 64 * 1024 * 1024
+
+# Number of threads listing the directories given by -r and sizing the files listed by --files-from
+WALK_THREADS = 8
+# Number of paths of --files-from sized and dispatched at once
+LIST_BATCH = 4096
+
+# Maximum number of blocks of a stream being processed or waiting for a worker at once, per process,
+# so that a stream faster than the workers does not fill up the memory
+STREAM_BLOCKS_PER_PROCESS = 2
+
+# Environment variable holding the secret shared by the coordinator and the worker daemons of --worker,
+# without which a connection is refused
+AUTHKEY_VARIABLE = "PWORDCOUNT_AUTHKEY"
+# Number of tasks sent ahead to every process of a worker daemon, so that it never waits for the coordinator
+WORKER_TASKS_PER_PROCESS = 2
+# Number of times a task of --worker is dispatched before the run fails, when it fails or its worker disconnects
+TASK_ATTEMPTS = 3
+
+# Magic bytes at the start of compressed files, and their compression formats
+COMPRESSION_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"))
+# Minimum size of the byte ranges of gzip members decompressed by a single task
+COMPRESSED_TASK_SIZE = 4 * 1024 * 1024
+# Magic numbers starting a block of a bzip2 stream, and ending the stream, at any bit offset
+BZ2_BLOCK_MAGIC = 0x314159265359
+BZ2_END_MAGIC = 0x177245385090
+# Errors raised when a unit of a compressed file cannot be decompressed on its own
+DECOMPRESSION_ERRORS = (EOFError, OSError, ValueError, zlib.error, lzma.LZMAError)
+
+# Number of lines of the list of mode -m o written to the output at once
+OUTPUT_LINES = 65536
+
+# Probability that an estimate of the Count-Min Sketch of --approx exceeds its error bound
+SKETCH_FAILURE_PROBABILITY = 0.01
+# Minimum number of most frequent words tracked by the Count-Min Sketch of --approx
+HEAVY_HITTERS = 1000
+# Number of distinct words gathered exactly before they are added to a sketch of --approx,
+# which keeps memory bounded while hashing each word once per batch rather than once per block;
+# also the number of distinct tokens normalized at once with the options of the tokenizer
+SKETCH_BATCH = 65536
+# Number of words joined at once into the buffer of a Vocabulary: bytes.join holds a buffer descriptor per word,
+# several times bigger than most words, so that joining millions of words at once would take more memory than the buffer
+PACK_BATCH = 65536
+
+# Modes of pwordcount: "t" counts the total words, "u" the unique words and "o" the occurrences of each word
+MODES = ("t", "u", "o")
+
+# Engines that can perform mode -m t: "shell" runs wc -w, "native" counts in-process
+ENGINES = ("shell", "native")
+# Options given as --name=value, and their values when not given
+DEFAULT_OPTIONS = {
+    "engine": "native",
+    "mmap": False,
+    # Directory of the result cache, None to disable it
+    "cache": None,
+    # Size in MiB above which the least recently used entries of the cache are evicted
+    "cache_size": 256,
+    # Whether to only count the bytes appended to the files since the last run, needs a cache directory
+    "incremental": False,
+    # Number of most frequent words listed by mode -m o, None to list them all
+    "top": None,
+    # Minimum number of occurrences of the words listed by mode -m o
+    "min_count": 1,
+    # Whether to estimate modes -m u and -m o with sketches of fixed size instead of exact sets and Counters
+    "approx": False,
+    # Relative error targeted by the sketches of --approx
+    "error": 0.01,
+    # Whether to record the duration of every phase of the run, and print a summary
+    "stats": False,
+    # File where the phases recorded by --stats are written as a Chrome trace, None to not write it
+    "trace": None,
+    # Glob patterns of the files counted in the directories given by -r and the list of --files-from, all files if empty
+    "include": (),
+    # Glob patterns of the files and directories left out of the directories and the list of --files-from
+    "exclude": (),
+    # File listing the paths of files to count, one per line, "-" for the standard input, None for no list
+    "files_from": None,
+    # How the words are split in every mode, one of TOKENIZERS
+    "tokenizer": "whitespace",
+    # Regular expression matching the words of the regex tokenizer
+    "pattern": None,
+    # Case normalization of the words, one of CASES, None to keep their case
+    "case": None,
+    # Whether to remove the punctuation at the start and end of every word
+    "strip_punctuation": False,
+    # File of words left out of every mode, normalized like the words, None to keep every word
+    "stopwords": None,
+    # Addresses of the worker daemons the tasks are dispatched to, "host:port" or the path of a Unix socket,
+    # the processes of the current machine if empty
+    "workers": (),
+}
+# Options that change the words counted, or how they are counted, part of the keys of the cache;
+# the others (engine, mmap, the cache itself, the output and the choice of files) give the same results
+CACHE_OPTIONS = ("tokenizer", "pattern", "case", "strip_punctuation", "stopwords", "approx", "error")
+# Version of the results stored in the cache, part of its keys, so that results stored in an older format are never loaded
+CACHE_FORMAT = 3
+# Number of bytes at the start of a file compared between runs of --incremental
+# to tell an appended file from a file that was rewritten
+FINGERPRINT_SIZE = 64 * 1024
+
+# Ways the files are scanned by the bench subcommand: "read" in blocks, "mmap" through a memory map
+BENCH_SCANS = ("read", "mmap")
+# Options of the bench subcommand, given as --name=value, and their values when not given
+BENCH_OPTIONS = {
+    # Size in MiB of the synthetic corpus, divided between its files
+    "size": 32,
+    # Number of distinct words of the synthetic corpus
+    "vocabulary": 50000,
+    # Number of words per line of the synthetic corpus
+    "line_length": 12,
+    # Seed of the synthetic corpus, the same seed giving the same corpus
+    "seed": 1,
+    # Existing files to use instead of a synthetic corpus, None to generate one
+    "corpus": None,
+    # Numbers of files the synthetic corpus is divided into, each one timed on its own
+    "files": [1],
+    "modes": ["t", "u", "o", "tuo"],
+    "engines": list(ENGINES),
+    "scans": list(BENCH_SCANS),
+    "processes": [1, 2, 4],
+    # Number of runs of every case, the fastest one is reported
+    "repeat": 3,
+    # File where the JSON report is written, None for the standard output
+    "output": None,
+    # JSON report of an earlier run, whose throughputs are compared with the new ones
+    "baseline": None,
+    # Relative drop of throughput from the baseline reported as a regression
+    "tolerance": 0.1,
+}
+
+# Options of the worker subcommand, given as --name=value, and their values when not given
+WORKER_OPTIONS = {
+    # Address the worker daemon listens on, "host:port" or the path of a Unix socket
+    "listen": None,
+    # Number of processes running the tasks sent to the worker daemon
+    "processes": os.cpu_count() or 1,
+}
 
 
 def calc_size(file: str) -> int:
     """
-    Returns the size in bytes of a given file
+    Returns the size in bytes of a given file
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    Ensures:
+    Returning the bytes size of a given file as an integer.
+    """
+    return os.path.getsize(file)
+
+
+def find_boundary(f, offset: int) -> int:
+    """
+    Finds the first whitespace byte located at or after a given offset of an open file.
+
+    Requires:
+    f (BinaryIO): A text file opened in binary mode.
+    offset (int): The byte offset from which to start searching.
+    Ensures:
+    Returning the offset of the first whitespace byte at or after offset,
+    or the size of the file if no whitespace follows offset.
+    """
+    f.seek(offset)
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            return offset
+        match = WHITESPACE.search(block)
+        if match:
+            return offset + match.start()
+        offset += len(block)
+
+
+def calc_chunks(file: str, num_chunks: int, start_byte: int = 0, end_byte: int = None) -> list:
+    """
+    Divides a text file, or a byte range of it, into byte ranges of roughly equal size,
+    aligning every boundary to a whitespace byte so that no word is split between two ranges.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    num_chunks (int): The number of ranges to divide the file into.
+    start_byte (int): The offset of the first byte to divide, 0 by default.
+    end_byte (int): The offset of the byte following the bytes to divide, the size of the file by default.
+    start_byte and end_byte must either be 0 and the size of the file, or offsets of whitespace bytes.
+    Ensures:
+    Returning a list of (start_byte, end_byte) tuples, end_byte excluded, covering the whole file or range.
+    Ranges that would be empty (e.g. a single word longer than a chunk) are left out,
+    so fewer than num_chunks ranges may be returned.
+    """
+    if end_byte is None:
+        end_byte = calc_size(file)
+    boundaries = [start_byte]
+
+    with open(file, 'rb') as f:
+        for i in range(1, num_chunks):
+            offset = max(start_byte + i * (end_byte - start_byte) // num_chunks, boundaries[-1])
+            boundaries.append(min(find_boundary(f, offset), end_byte))
+    boundaries.append(end_byte)
+
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def find_last_boundary(file: str, start_byte: int, end_byte: int) -> int:
+    """
+    Finds the last whitespace byte of a byte range of a text file.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    start_byte (int): The offset of the first byte of the range.
+    end_byte (int): The offset of the byte following the range.
+    Ensures:
+    Returning the offset of the last whitespace byte of the range,
+    or start_byte if the range has no whitespace.
+    Every byte after the returned offset belongs to the last word of the range,
+    which may still be incomplete if the file is being written.
+    """
+    with open(file, 'rb') as f:
+        position = end_byte
+        while position > start_byte:
+            block_start = max(position - BLOCK_SIZE, start_byte)
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            last = max(block.rfind(c) for c in WHITESPACE_BYTES)
+            if last != -1:
+                return block_start + last
+            position = block_start
+    return start_byte
+
+
+def count_words(file: str, start_byte: int, end_byte: int) -> int:
+    """
+    Counts the words in a byte range of a text file without leaving the current process,
+    following the same rules as wc -w: a word is a maximal run of non-whitespace bytes.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    start_byte (int): The offset of the first byte of the range.
+    end_byte (int): The offset of the byte following the range.
+    Ensures:
+    Returning the number of words in the range, reading it in blocks of BLOCK_SIZE bytes
+    into a single reused buffer. A word cut by the end of a block is only counted once.
+    """
+    buffer = bytearray(BLOCK_SIZE)
+    view = memoryview(buffer)
+    words = 0
+    # Whether the previous block ended in the middle of a word
+    in_word = False
+
+    with open(file, 'rb', buffering=0) as f:
+        f.seek(start_byte)
+        remaining = end_byte - start_byte
+        while remaining > 0:
+            read = f.readinto(view[:min(BLOCK_SIZE, remaining)])
+            if not read:
+                break
+            remaining -= read
+            marks = (buffer if read == BLOCK_SIZE else buffer[:read]).translate(WORD_MARKS)
+            # Every word starts right after a whitespace byte, except possibly the first one
+            words += marks.count(b" x")
+            if marks[0] == 120 and not in_word:
+                words += 1
+            in_word = marks[-1] == 120
+
+    return words
+
+
+def read_blocks(file: str, start_byte: int, end_byte: int):
+    """
+    Reads a byte range of a text file, one block at a time.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    start_byte (int): The offset of the first byte of the range.
+    end_byte (int): The offset of the byte following the range.
+    Ensures:
+    Yielding the range in blocks (bytes), each one ending on a whitespace byte or at end_byte,
+    so that no word, and no multi-byte character, is split between two blocks.
+    A word cut by the end of a block read is carried over to the next one.
+    """
+    with open(file, 'rb') as f:
+        f.seek(start_byte)
+        remaining = end_byte - start_byte
+        carry = b""
+        while remaining > 0:
+            block = f.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            # Cut the block after its last whitespace byte, the rest goes to the next block
+            cut = max(block.rfind(c) for c in WHITESPACE_BYTES) + 1
+            if cut == 0:
+                carry += block
+                continue
+            yield carry + block[:cut]
+            carry = block[cut:]
+        if carry:
+            yield carry
+
+
+def map_blocks(file: str, start_byte: int, end_byte: int):
+    """
+    Scans a byte range of a text file through a read-only memory map of the file,
+    one block at a time, so that the file is never read into the memory of the process as a whole.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    start_byte (int): The offset of the first byte of the range.
+    end_byte (int): The offset of the byte following the range.
+    Ensures:
+    Yielding the range in blocks (bytes) of about BLOCK_SIZE bytes, each one ending on a whitespace byte
+    or at end_byte, so that no word is split between two blocks. The pages of the map are those of the
+    page cache, shared by every process mapping the same file.
+    """
+    if start_byte >= end_byte:
+        # Empty files cannot be mapped
+        return
+
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+        if hasattr(mapping, "madvise"):
+            mapping.madvise(mmap.MADV_SEQUENTIAL)
+        position = start_byte
+        while position < end_byte:
+            block_end = min(position + BLOCK_SIZE, end_byte)
+            if block_end < end_byte:
+                match = WHITESPACE.search(mapping, block_end, end_byte)
+                block_end = match.start() if match else end_byte
+            yield mapping[position:block_end]
+            position = block_end
+
+
+def count_block(block: bytes) -> int:
+    """
+    Counts the words in a block of bytes, following the same rules as count_words.
+
+    Requires:
+    block (bytes): A block of bytes that does not start or end in the middle of a word.
+    Ensures:
+    Returning the number of words in the block.
+    """
+    if not block:
+        return 0
+    marks = block.translate(WORD_MARKS)
+    return marks.count(b" x") + (marks[0] == 120)
+
+
+def is_plain(options: dict) -> bool:
+    """
+    Tells whether the words are split by whitespace as they are, without any option of the tokenizer.
+
+    Requires:
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning True if the words are the runs of non-whitespace bytes, as counted by count_words and count_block,
+    False if they are given by make_tokenizer.
+    """
+    return (options["tokenizer"] == "whitespace" and options["case"] is None
+            and not options["strip_punctuation"] and options["stopwords"] is None)
+
+
+def file_identity(file: str) -> tuple:
+    """
+    Identifies the contents of a file by its path and metadata, without reading it.
+
+    Requires:
+    file (str): str indicating a file's directory.
+    Ensures:
+    Returning a tuple (path, size, mtime, inode), where path is the real path of the file,
+    that changes whenever the file is modified or replaced, whatever the relative path it is given by.
+    """
+    stat = os.stat(file)
+    return os.path.realpath(file), stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+@lru_cache(maxsize=None)
+def make_tokenizer(tokenizer: str, pattern: str, case: str, strip_punctuation: bool, stopwords: tuple) -> callable:
+    """
+    Builds the function splitting a whitespace-separated token into words with the options of the tokenizer.
+    It is built once per process and stopwords file, with its regular expressions compiled and its stopwords read.
+    ASCII tokens are split without being decoded, with bytes methods and bytes versions of the regular expressions;
+    other tokens are decoded, split and their words encoded again.
+
+    Requires:
+    tokenizer (str): One of TOKENIZERS.
+    pattern (str): The regular expression of the regex tokenizer, matched within every token, or None; empty matches are left out.
+    case (str): One of CASES, or None to keep the case of the words.
+    strip_punctuation (bool): Whether to remove the punctuation at the start and end of every token.
+    stopwords (tuple): The file_identity of a file of words left out of every mode, or None.
+    Ensures:
+    Returning a function that takes a token (bytes) and returns the tuple of its words (bytes),
+    normalized and without the stopwords, which are split and normalized the same way.
+    """
+    if tokenizer == "regex":
+        text_words = re.compile(pattern)
+        try:
+            byte_words = re.compile(pattern.encode())
+        except re.error:
+            byte_words = None
+    elif tokenizer == "unicode":
+        text_words, byte_words = UNICODE_WORD, ASCII_WORD
+    else:
+        text_words = byte_words = None
+
+    def find_words(expression, data):
+        # findall returns the groups of the matches instead of the matches if the expression has any;
+        # empty matches, e.g. of \w* between the words, are not words
+        if expression.groups:
+            return tuple(word for word in (match.group() for match in expression.finditer(data)) if word)
+        return tuple(word for word in expression.findall(data) if word)
+
+    def tokenize(token):
+        if token.isascii() and (byte_words is not None or text_words is None):
+            if case:
+                # Lowercase and case folding are the same on ASCII
+                token = token.lower()
+            if strip_punctuation:
+                token = token.strip(ASCII_PUNCTUATION)
+            if byte_words is None:
+                return (token,) if token else ()
+            return find_words(byte_words, token)
+        text = token.decode('utf-8', errors='replace')
+        if case == "lower":
+            text = text.lower()
+        elif case == "fold":
+            text = text.casefold()
+        if strip_punctuation:
+            text = UNICODE_PUNCTUATION.sub("", text)
+        if text_words is None:
+            return (text.encode(),) if text else ()
+        return tuple(word.encode() for word in find_words(text_words, text))
+
+    if stopwords is None:
+        return tokenize
+    with open(stopwords[0], 'rb') as f:
+        excluded = frozenset(word for token in f.read().split() for word in tokenize(token))
+    return lambda token: tuple(word for word in tokenize(token) if word not in excluded)
+
+
+def check_tokenizer(options: dict) -> None:
+    """
+    Checks that the options of the tokenizer can be used together.
+
+    Requires:
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Raising ValueError if the tokenizer or the case is unknown, if the regex tokenizer has no valid pattern,
+    or if --engine=shell, which only counts whitespace-separated words, is given with other options of the tokenizer.
+    """
+    if options["tokenizer"] not in TOKENIZERS:
+        raise ValueError(f"invalid tokenizer: {options['tokenizer']!r}, expected one of {', '.join(TOKENIZERS)}")
+    if options["case"] is not None and options["case"] not in CASES:
+        raise ValueError(f"invalid case: {options['case']!r}, expected one of {', '.join(CASES)}")
+    if options["tokenizer"] == "regex":
+        if not options["pattern"]:
+            raise ValueError("the regex tokenizer needs a pattern, given by --pattern=REGEX")
+        try:
+            re.compile(options["pattern"])
+        except re.error as error:
+            raise ValueError(f"invalid pattern: {options['pattern']!r}, {error}")
+    if options["engine"] == "shell" and not is_plain(options):
+        raise ValueError("--engine=shell only counts words separated by whitespace, without the options of the tokenizer")
+
+
+def is_count(value) -> bool:
+    """
+    Tells whether a value is a positive integer, and not a bool.
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def check_options(options: dict) -> None:
+    """
+    Checks the values of the options given to pwordcount, on the command line (see parse_options) or to count.
+
+    Requires:
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Raising ValueError if the engine is unknown, if cache_size, top or min_count is not a positive integer,
+    if error is not a number between 0 and 1, if incremental is given without a cache directory,
+    if workers are given without the secret of AUTHKEY_VARIABLE, if the stopwords file does not exist,
+    or if the options of the tokenizer are invalid (see check_tokenizer).
+    """
+    if options["engine"] not in ENGINES:
+        raise ValueError(f"invalid engine: {options['engine']!r}, expected one of {', '.join(ENGINES)}")
+    for name in ("cache_size", "min_count") + (("top",) if options["top"] is not None else ()):
+        if not is_count(options[name]):
+            raise ValueError(f"invalid {name}: {options[name]!r}, expected a positive integer")
+    if not isinstance(options["error"], (int, float)) or isinstance(options["error"], bool) or not 0 < options["error"] < 1:
+        raise ValueError(f"invalid error: {options['error']!r}, expected a number between 0 and 1")
+    if options["incremental"] and not options["cache"]:
+        raise ValueError("incremental needs a cache directory, given by --cache=DIR")
+    if options["workers"] and AUTHKEY_VARIABLE not in os.environ:
+        raise ValueError(f"workers need the secret shared with them, given by the {AUTHKEY_VARIABLE} environment variable")
+    if options["stopwords"] is not None and not os.path.isfile(options["stopwords"]):
+        raise ValueError(f"stopwords file does not exist: {options['stopwords']}")
+    check_tokenizer(options)
+
+
+def normalize_counts(token_counts: Counter, options: dict) -> tuple:
+    """
+    Splits counted tokens into words with the options of the tokenizer.
+    Every distinct token is only split once, however many times it occurs,
+    so that the cost of the tokenizer does not grow with the length of the text.
+
+    Requires:
+    token_counts (Counter): The occurrences of whitespace-separated tokens (bytes).
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a tuple (word_counts, total), where word_counts is a Counter of the occurrences of the words (bytes)
+    given by make_tokenizer for the tokens, and total is the number of words.
+    """
+    stopwords = options["stopwords"] and file_identity(options["stopwords"])
+    tokenize = make_tokenizer(options["tokenizer"], options["pattern"], options["case"],
+                              options["strip_punctuation"], stopwords)
+    word_counts = Counter()
+    total = 0
+    for token, occurrences in token_counts.items():
+        for word in tokenize(token):
+            word_counts[word] += occurrences
+            total += occurrences
+    return word_counts, total
+
+
+def count_tokens(block: bytes, options: dict) -> int:
+    """
+    Counts the words in a block of bytes, following the options of the tokenizer.
+
+    Requires:
+    block (bytes): A block of bytes that does not start or end in the middle of a word.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning the number of words of the block: counted by count_block if is_plain(options),
+    given by normalize_counts otherwise.
+    """
+    if is_plain(options):
+        return count_block(block)
+    return normalize_counts(Counter(block.split()), options)[1]
+
+
+def decode_occurrences(word_counts: Counter) -> Counter:
+    """
+    Decodes a Counter of occurrences of words collected as bytes.
+
+    Requires:
+    word_counts (Counter): The occurrences of each word (bytes).
+    Ensures:
+    Returning a Counter of the occurrences of each decoded word (str).
+    Words that decode to the same str (invalid UTF-8) have their occurrences added.
+    """
+    decoded_counts = Counter()
+    for word, occurences in word_counts.items():
+        decoded_counts[word.decode('utf-8', errors='replace')] += occurences
+    return decoded_counts
+
+
+def hash_word(word: bytes) -> int:
+    """
+    Hashes a word into 64 bits, the same way in every process and every run.
+
+    Requires:
+    word (bytes): A word.
+    Ensures:
+    Returning a 64-bit int, given by BLAKE2b, uniformly distributed.
+    """
+    return int.from_bytes(hashlib.blake2b(word, digest_size=8).digest(), 'little')
+
+
+def new_hyperloglog(options: dict) -> bytearray:
+    """
+    Creates an empty HyperLogLog, the estimator of the number of unique words of --approx.
+    Its number of registers m is the smallest power of two giving a standard error 1.04 / sqrt(m)
+    below options["error"].
+
+    Requires:
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a bytearray of m registers set to 0, one byte each.
+    """
+    registers = max(16, 2 ** math.ceil(math.log2((1.04 / options["error"]) ** 2)))
+    return bytearray(registers)
+
+
+def add_hyperloglog(registers: bytearray, words: set) -> None:
+    """
+    Adds words to a HyperLogLog.
+
+    Requires:
+    registers (bytearray): A HyperLogLog, as given by new_hyperloglog.
+    words (set): The words (bytes) to add.
+    Ensures:
+    Updating every register with the position of the first 1 bit of the hashes that fall into it.
+    """
+    index_bits = len(registers).bit_length() - 1
+    rank_bits = 64 - index_bits
+    rank_mask = (1 << rank_bits) - 1
+    for word in words:
+        word_hash = hash_word(word)
+        index = word_hash >> rank_bits
+        rank = rank_bits - (word_hash & rank_mask).bit_length() + 1
+        if rank > registers[index]:
+            registers[index] = rank
+
+
+def merge_hyperloglog(first: bytearray, second: bytearray) -> bytearray:
+    """
+    Merges two partial results of mode -m u with --approx.
+
+    Requires:
+    first (bytearray): The HyperLogLog of a part of a file.
+    second (bytearray): The HyperLogLog of another part of the file, with as many registers.
+    Ensures:
+    Returning the HyperLogLog of both parts, the maximum of every register.
+    """
+    return bytearray(map(max, first, second))
+
+
+def estimate_hyperloglog(registers: bytearray) -> int:
+    """
+    Estimates the number of unique words added to a HyperLogLog.
+
+    Requires:
+    registers (bytearray): A HyperLogLog, as given by new_hyperloglog.
+    Ensures:
+    Returning the estimate, using linear counting for small cardinalities.
+    """
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -register for register in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return round(estimate)
+
+
+def new_sketch(options: dict) -> dict:
+    """
+    Creates an empty Count-Min Sketch, the estimator of the occurrences of each word of --approx,
+    along with the most frequent words seen so far (heavy hitters).
+    Its width e / options["error"] bounds the error of every estimate to options["error"] times the number of words,
+    and its depth ln(1 / SKETCH_FAILURE_PROBABILITY) bounds the probability to exceed that error.
+
+    Requires:
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a dict with the counters of the sketch, "table", a list of depth arrays of width 64-bit counters,
+    the number of words added, "total", the heavy hitters, "candidates", a dict of words (bytes) to estimates,
+    and the number of heavy hitters to keep, "capacity", at least options["top"].
+    """
+    width = math.ceil(math.e / options["error"])
+    depth = math.ceil(math.log(1 / SKETCH_FAILURE_PROBABILITY))
+    return {
+        "table": [array('Q', bytes(8 * width)) for _ in range(depth)],
+        "total": 0,
+        "candidates": {},
+        "capacity": max(HEAVY_HITTERS, options["top"] or 0),
+    }
+
+
+def sketch_positions(sketch: dict, word: bytes) -> list:
+    """
+    Finds the counters of a word in every row of a Count-Min Sketch.
+
+    Requires:
+    sketch (dict): A Count-Min Sketch, as given by new_sketch.
+    word (bytes): A word.
+    Ensures:
+    Returning one column per row, each one taken from a different 32 bits of a BLAKE2b hash of the word,
+    so that two words sharing a counter in one row are unlikely to share it in the others.
+    """
+    table = sketch["table"]
+    digest = hashlib.blake2b(word, digest_size=4 * len(table)).digest()
+    width = len(table[0])
+    return [int.from_bytes(digest[4 * row:4 * row + 4], 'little') % width for row in range(len(table))]
+
+
+def estimate_sketch(sketch: dict, word: bytes) -> int:
+    """
+    Estimates the occurrences of a word added to a Count-Min Sketch.
+
+    Requires:
+    sketch (dict): A Count-Min Sketch, as given by new_sketch.
+    word (bytes): A word.
+    Ensures:
+    Returning the smallest counter of the word, never below its actual number of occurrences.
+    """
+    return min(row[column] for row, column in zip(sketch["table"], sketch_positions(sketch, word)))
+
+
+def prune_sketch(sketch: dict) -> None:
+    """
+    Keeps only the most frequent heavy hitters of a Count-Min Sketch, once they are twice as many as its capacity.
+
+    Requires:
+    sketch (dict): A Count-Min Sketch, as given by new_sketch.
+    Ensures:
+    Updating the estimates of the heavy hitters and keeping the sketch["capacity"] highest ones,
+    so that the sketch keeps a fixed size.
+    """
+    candidates = sketch["candidates"]
+    if len(candidates) > 2 * sketch["capacity"]:
+        for word in candidates:
+            candidates[word] = estimate_sketch(sketch, word)
+        sketch["candidates"] = dict(heapq.nlargest(sketch["capacity"], candidates.items(), key=itemgetter(1)))
+
+
+def add_sketch(sketch: dict, word_counts: Counter) -> None:
+    """
+    Adds occurrences of words to a Count-Min Sketch.
+
+    Requires:
+    sketch (dict): A Count-Min Sketch, as given by new_sketch.
+    word_counts (Counter): The occurrences of each word (bytes) to add.
+    Ensures:
+    Adding the occurrences to the counters of every word, and tracking the words as heavy hitters.
+    """
+    table = sketch["table"]
+    candidates = sketch["candidates"]
+    for word, occurences in word_counts.items():
+        estimate = None
+        for row, column in zip(table, sketch_positions(sketch, word)):
+            row[column] += occurences
+            if estimate is None or row[column] < estimate:
+                estimate = row[column]
+        candidates[word] = estimate
+    sketch["total"] += sum(word_counts.values())
+    prune_sketch(sketch)
+
+
+def merge_sketch(first: dict, second: dict) -> dict:
+    """
+    Merges two partial results of mode -m o with --approx.
+
+    Requires:
+    first (dict): The Count-Min Sketch of a part of a file.
+    second (dict): The Count-Min Sketch of another part of the file, of the same width and depth.
+    Ensures:
+    Returning the Count-Min Sketch of both parts, reusing first: counters are added,
+    and the heavy hitters of both are kept, up to the capacity of the sketch.
+    """
+    for row, other_row in zip(first["table"], second["table"]):
+        for column, count in enumerate(other_row):
+            if count:
+                row[column] += count
+    first["total"] += second["total"]
+    first["candidates"].update(second["candidates"])
+    prune_sketch(first)
+    return first
+
+
+def sketch_occurrences(sketch: dict) -> Counter:
+    """
+    Returns the estimated occurrences of the heavy hitters of a Count-Min Sketch.
+
+    Requires:
+    sketch (dict): A Count-Min Sketch, as given by new_sketch.
+    Ensures:
+    Returning a Counter of the estimated occurrences of each heavy hitter, decoded (str).
+    """
+    return decode_occurrences(Counter({word: estimate_sketch(sketch, word) for word in sketch["candidates"]}))
+
+
+def find_total(file: str, start_byte: int, end_byte: int, options: dict) -> int:
+    """
+    Counts the words in a byte range of a text file, using the engine given in the options.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    start_byte (int): The offset of the first byte of the range.
+    end_byte (int): The offset of the byte following the range.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning the number of words in the range, as split by count_tokens.
+    """
+    if options["engine"] == "shell":
+        # tail -c seeks straight to start_byte, head -c stops reading at end_byte, and tr turns every byte
+        # but whitespace into a printable one, as wc -w leaves out the words without any printable character
+        words = subprocess.run(f"tail -c +{start_byte + 1} {shlex.quote(file)} | head -c {end_byte - start_byte} "
+                               f"| LC_ALL=C tr -c ' \\t\\n\\r\\v\\f' x | LC_ALL=C wc -w",
+                               shell=True, text=True, stdout=subprocess.PIPE).stdout.strip()
+        return int(words)
+    if options["mmap"]:
+        # Blocks never split a word, so they can be counted on their own
+        return sum(count_tokens(block, options) for block in map_blocks(file, start_byte, end_byte))
+    if not is_plain(options):
+        return sum(count_tokens(block, options) for block in read_blocks(file, start_byte, end_byte))
+    return count_words(file, start_byte, end_byte)
+
+
+def new_partial(modes: str, options: dict) -> dict:
+    """
+    Creates the empty partial result of the given modes.
+
+    Requires:
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a dict mapping every mode to its empty result: 0 for "t", an empty set for "u"
+    and an empty Counter for "o", or with --approx an empty HyperLogLog for "u" and an empty Count-Min Sketch for "o".
+    Together with "o", "u" is None without --approx: the unique words are the words of "o" (see make_result).
+    """
+    partial = {}
+    if "t" in modes:
+        partial["t"] = 0
+    if "u" in modes and "o" in modes and not options["approx"]:
+        # Every word of mode "o" is a unique word, they are not collected twice
+        partial["u"] = None
+    elif "u" in modes:
+        partial["u"] = new_hyperloglog(options) if options["approx"] else set()
+    if "o" in modes:
+        partial["o"] = new_sketch(options) if options["approx"] else Counter()
+    return partial
+
+
+def add_batch(partial: dict, batch: object, options: dict) -> None:
+    """
+    Adds a batch of words to the modes "u" and "o" of a partial result.
+
+    Requires:
+    partial (dict): A partial result, as given by new_partial.
+    batch (object): A Counter of the occurrences of some words if partial has mode "o", a set of words otherwise;
+    without --approx, any iterable of words, each occurrence counted once.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Updating the set or HyperLogLog of mode "u" with the words of the batch, unless it is None (see new_partial),
+    and the Counter or Count-Min Sketch of mode "o" with their occurrences.
+    """
+    if partial.get("u") is not None:
+        if options["approx"]:
+            add_hyperloglog(partial["u"], batch)
+        else:
+            partial["u"].update(batch)
+    if "o" in partial:
+        if options["approx"]:
+            add_sketch(partial["o"], batch)
+        else:
+            partial["o"].update(batch)
+
+
+def scan_words(partial: dict, word_lists, options: dict) -> dict:
+    """
+    Adds words to a partial result, computing all of its modes in a single pass.
+    Without --approx or the options of the tokenizer, every list of words is added to the partial result as it is.
+    Otherwise, the words are gathered in a batch, a Counter, or a set without mode "o", added to the partial result
+    every SKETCH_BATCH distinct words, so that memory stays bounded: with --approx, every word of a batch is hashed once,
+    and with the options of the tokenizer, the batch holds the whitespace-separated tokens as they are,
+    split into words by normalize_counts once per distinct token.
+
+    Requires:
+    partial (dict): A partial result, as given by new_partial.
+    word_lists (iterable): Lists of whitespace-separated words (bytes), e.g. blocks of bytes split by bytes.split.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning partial, updated with every word: mode "t" counts the words of the lists,
+    while modes "u" and "o" are updated by add_batch.
+    """
+    plain = is_plain(options)
+    collect = "u" in partial or "o" in partial
+    batched = options["approx"] or not plain
+    batch = Counter() if "o" in partial or not plain else set()
+    total = 0
+
+    def add_words():
+        # Adds the batch to the partial result, split into words first with the options of the tokenizer
+        nonlocal total
+        words = batch
+        if not plain:
+            words, num_words = normalize_counts(batch, options)
+            total += num_words
+        if collect:
+            add_batch(partial, words, options)
+        batch.clear()
+
+    for words in word_lists:
+        if plain:
+            total += len(words)
+        if not batched:
+            if collect:
+                add_batch(partial, words, options)
+        elif collect or not plain:
+            batch.update(words)
+            if len(batch) >= SKETCH_BATCH:
+                add_words()
+    if batched:
+        add_words()
+    if "t" in partial:
+        partial["t"] += total
+    return partial
+
+
+@dataclass
+class Vocabulary:
+    """
+    The unique words of mode -m u, or the occurrences of mode -m o, in a compact form: the words (bytes) are packed
+    in a single buffer, each one followed by a newline, which no word contains, and their occurrences are held
+    in an array, in the same order. The position of a word is its id, found through an index of the words,
+    built only when other words are merged into the vocabulary (see merge_vocabularies),
+    so that a Vocabulary is sent between processes and stored in the cache as two flat buffers.
+
+    words (bytearray): The words, each one followed by a newline.
+    counts (array): The occurrences of each word, by id, or None for mode -m u.
+    index (object): The id of each word (dict), or for mode -m u the set of the words, which have no occurrences
+    to find by id; None if it was not built. It is left out when pickled.
+    """
+    words: bytearray
+    counts: array = None
+    index: dict = None
+
+    def __getstate__(self) -> dict:
+        return dict(self.__dict__, index=None)
+
+
+def append_words(buffer: bytearray, words) -> None:
+    """
+    Appends words to the buffer of a Vocabulary, PACK_BATCH words at a time.
+
+    Requires:
+    buffer (bytearray): The words of a Vocabulary.
+    words (iterable): The words (bytes) to append, none of them in buffer.
+    Ensures:
+    Appending every word to buffer, followed by a newline.
+    """
+    words = iter(words)
+    while True:
+        batch = list(islice(words, PACK_BATCH))
+        if not batch:
+            break
+        buffer += b"\n".join(batch)
+        buffer += b"\n"
+
+
+def pack_vocabulary(batch: object) -> Vocabulary:
+    """
+    Packs words collected as bytes into a Vocabulary.
+
+    Requires:
+    batch (object): A Counter of the occurrences of some words (bytes), or a set of words (bytes).
+    Ensures:
+    Returning a Vocabulary of the words of batch, with their occurrences if batch is a Counter.
+    """
+    words = bytearray()
+    append_words(words, batch)
+    return Vocabulary(words, array('Q', batch.values()) if isinstance(batch, Counter) else None)
+
+
+def split_vocabulary(vocabulary: Vocabulary) -> list:
+    """
+    Splits the buffer of a Vocabulary into its words.
+
+    Requires:
+    vocabulary (Vocabulary): A Vocabulary, as given by pack_vocabulary or merge_vocabularies.
+    Ensures:
+    Returning the list of the words (bytes) of the vocabulary, by id. The buffer is split on every newline,
+    as in unpack_vocabulary, so that an empty word keeps its id and the words stay aligned with their occurrences.
+    """
+    words = bytes(vocabulary.words).split(b"\n")
+    # The empty entry after the last newline
+    words.pop()
+    return words
+
+
+def vocabulary_index(vocabulary: Vocabulary) -> dict:
+    """
+    Returns the index of a Vocabulary, building it if needed.
+
+    Requires:
+    vocabulary (Vocabulary): A Vocabulary, as given by pack_vocabulary.
+    Ensures:
+    Returning a dict mapping every word (bytes) of the vocabulary to its id, or the set of its words
+    if it has no occurrences, kept in vocabulary.index.
+    """
+    if vocabulary.index is None:
+        words = split_vocabulary(vocabulary)
+        # A set takes less memory than a dict, and its words need no int object for their ids
+        vocabulary.index = set(words) if vocabulary.counts is None else dict(zip(words, range(len(words))))
+    return vocabulary.index
+
+
+def merge_vocabularies(first: Vocabulary, second: Vocabulary) -> Vocabulary:
+    """
+    Merges two vocabularies of the same mode, remapping the words of one of them to the ids of the other.
+    The words are merged into the vocabulary whose index is already built, or else into the biggest one,
+    so that the words are indexed once however many vocabularies are merged into the same one.
+
+    Requires:
+    first (Vocabulary): The words of a part of a file.
+    second (Vocabulary): The words of another part of the file.
+    Ensures:
+    Returning the Vocabulary of both parts, reusing first or second: the occurrences of the words found in both
+    are added, and the other words are appended with new ids.
+    """
+    if first.index is None and (second.index is not None or len(second.words) > len(first.words)):
+        first, second = second, first
+    if not second.words:
+        return first
+
+    index = vocabulary_index(first)
+    words = split_vocabulary(second)
+    if first.counts is None:
+        new_words = [word for word in words if word not in index]
+    else:
+        new_words = []
+        counts = first.counts
+        for word, occurences in zip(words, second.counts):
+            word_id = index.get(word)
+            if word_id is None:
+                new_words.append(word)
+                counts.append(occurences)
+            else:
+                counts[word_id] += occurences
+    if new_words:
+        index.update(new_words if first.counts is None else zip(new_words, range(len(index), len(index) + len(new_words))))
+        append_words(first.words, new_words)
+    return first
+
+
+def unpack_vocabulary(vocabulary: Vocabulary) -> object:
+    """
+    Decodes the words of a Vocabulary.
+
+    Requires:
+    vocabulary (Vocabulary): A Vocabulary, as given by pack_vocabulary or merge_vocabularies.
+    Ensures:
+    Returning the set of the decoded words (str), or a Counter of the occurrences of each decoded word
+    if the vocabulary has occurrences. The buffer is decoded at once, invalid UTF-8 being replaced
+    as in every word on its own; words that decode to the same str have their occurrences added.
+    """
+    words = vocabulary.words.decode('utf-8', errors='replace').split("\n")
+    # The empty string after the last newline
+    words.pop()
+    if vocabulary.counts is None:
+        return set(words)
+
+    word_counts = Counter(dict(zip(words, vocabulary.counts)))
+    if len(word_counts) < len(words):
+        word_counts = Counter()
+        for word, occurences in zip(words, vocabulary.counts):
+            word_counts[word] += occurences
+    return word_counts
+
+
+def is_utf8(data: bytes) -> bool:
+    """
+    Tells whether bytes are valid UTF-8.
+
+    Requires:
+    data (bytes): Any bytes, e.g. the buffer of a Vocabulary.
+    Ensures:
+    Returning True if data decodes as UTF-8 without errors. ASCII data is told apart without being decoded.
+    """
+    if data.isascii():
+        return True
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def vocabulary_size(vocabulary: Vocabulary) -> int:
+    """
+    Counts the decoded words of a Vocabulary.
+
+    Requires:
+    vocabulary (Vocabulary): A Vocabulary, as given by pack_vocabulary or merge_vocabularies.
+    Ensures:
+    Returning the number of words given by unpack_vocabulary, without building them if the words are valid UTF-8:
+    distinct words then decode to distinct str, and there is one newline per word.
+    """
+    if is_utf8(vocabulary.words):
+        return vocabulary.words.count(b"\n")
+    return len(unpack_vocabulary(vocabulary))
+
+
+def pack_partial(partial: dict, options: dict) -> dict:
+    """
+    Packs the words of a partial result collected as bytes.
+
+    Requires:
+    partial (dict): A partial result, as given by scan_words for lists of words (bytes).
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning partial, with the set of mode "u" and the Counter of mode "o" packed by pack_vocabulary.
+    The sketches of --approx are left as they are, they already have a fixed size.
+    """
+    if options["approx"]:
+        return partial
+    for mode in ("u", "o"):
+        if partial.get(mode) is not None:
+            partial[mode] = pack_vocabulary(partial[mode])
+    return partial
+
+
+def count_range(file: str, start_byte: int, end_byte: int, modes: str, options: dict) -> dict:
+    """
+    Computes the given modes for a byte range of a text file, reading it once whatever the number of modes.
+    It is run by the workers of a pool, each one reading a different byte range.
+    Mode "t" alone is counted by find_total, with the engine given in the options;
+    together with other modes, it is the number of words split for them.
+    Words are split from blocks of bytes by scan_words, and packed by pack_partial without being decoded;
+    with --mmap, the blocks are scanned from a memory map.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    start_byte (int): The offset of the first byte of the range.
+    end_byte (int): The offset of the byte following the range.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning the partial result of the range, a dict mapping every mode to its result (see new_partial),
+    to be merged with the partial results of the other ranges by merge_partials.
+    """
+    if modes == "t":
+        return {"t": find_total(file, start_byte, end_byte, options)}
+
+    partial = new_partial(modes, options)
+    blocks = map_blocks(file, start_byte, end_byte) if options["mmap"] else read_blocks(file, start_byte, end_byte)
+    scan_words(partial, (block.split() for block in blocks), options)
+    return pack_partial(partial, options)
+
+
+def merge_total(first: int, second: int) -> int:
+    """
+    Merges two partial results of mode -m t.
+
+    Requires:
+    first (int): The number of words in a part of a file.
+    second (int): The number of words in another part of the file.
+    Ensures:
+    Returning the sum of both numbers.
+    """
+    return first + second
+
+
+def merge_unique(first: Vocabulary, second: Vocabulary) -> Vocabulary:
+    """
+    Merges two partial results of mode -m u.
+
+    Requires:
+    first (Vocabulary): The unique words of a part of a file.
+    second (Vocabulary): The unique words of another part of the file.
+    Ensures:
+    Returning the union of both, as given by merge_vocabularies.
+    """
+    return merge_vocabularies(first, second)
+
+
+def merge_occurrences(first: Vocabulary, second: Vocabulary) -> Vocabulary:
+    """
+    Merges two partial results of mode -m o.
+
+    Requires:
+    first (Vocabulary): The occurrences of each word in a part of a file.
+    second (Vocabulary): The occurrences of each word in another part of the file.
+    Ensures:
+    Returning the sum of both, as given by merge_vocabularies.
+    """
+    return merge_vocabularies(first, second)
+
+
+def merge_function(mode: str, options: dict) -> callable:
+    """
+    Returns the function merging two partial results of the given mode.
+
+    Requires:
+    mode (str): One of the modes of pwordcount: "t", "u", or "o".
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning merge_total, merge_unique or merge_occurrences,
+    or with --approx merge_hyperloglog or merge_sketch.
+    """
+    if (mode == "t"):
+        return merge_total
+    elif (mode == "u"):
+        return merge_hyperloglog if options["approx"] else merge_unique
+    else:
+        return merge_sketch if options["approx"] else merge_occurrences
+
+
+def merge_partials(first: dict, second: dict, options: dict) -> dict:
+    """
+    Merges two partial results of the same modes.
+
+    Requires:
+    first (dict): The partial result of a part of a file, as given by count_range.
+    second (dict): The partial result of another part of the file.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning the merge of both partial results, merging every mode with merge_function, reusing first.
+    Mode "u" is left as None if it is given by mode "o" (see new_partial).
+    """
+    for mode in first:
+        if first[mode] is not None:
+            first[mode] = merge_function(mode, options)(first[mode], second[mode])
+    return first
+
+
+def reduce_partials(partials: list, empty: dict, options: dict, pool: multiprocessing.Pool) -> dict:
+    """
+    Merges the partial results returned by the workers into a single result.
+    While there are more than TREE_REDUCTION_THRESHOLD partial results, they are merged
+    two by two by the workers of the pool, halving their number in every round;
+    the remaining ones are then merged in the current process.
+
+    Requires:
+    partials (list): The partial results to merge, as given by count_range.
+    empty (dict): The result of merging no partial results, as given by pack_partial for new_partial.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    pool (multiprocessing.Pool): The pool whose workers perform the rounds of the tree reduction.
+    Ensures:
+    Returning the merge of every partial result.
+    """
+    while len(partials) > TREE_REDUCTION_THRESHOLD:
+        merged = pool.starmap(merge_partials, [(first, second, options) for first, second in zip(partials[0::2], partials[1::2])])
+        if len(partials) % 2:
+            merged.append(partials[-1])
+        partials = merged
+
+    result = empty
+    for partial in partials:
+        result = merge_partials(result, partial, options)
+    return result
+
+
+def cache_entry(file: str, modes: str, options: dict) -> str:
+    """
+    Finds where the result of a text file is stored in the cache.
+    The entry is identified by CACHE_FORMAT, the path of the file, its size, modification time and inode,
+    the given modes and the options of CACHE_OPTIONS that apply, so that a modified or replaced file
+    never matches the entry of its previous contents; the stopwords file is identified the same way.
+    --top and --min-count are only part of it when the stored occurrences may be reduced to the words they select.
+    With --incremental, the entry holds the progress of the file instead (see load_progress),
+    and is identified by the same values except the size and modification time, which change as the file grows.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, with a cache directory.
+    Ensures:
+    Returning the path of the entry of the file in the cache directory, which may not exist.
+    """
+    stat = os.stat(file)
+    relevant_options = {name: options[name] for name in CACHE_OPTIONS}
+    if options["tokenizer"] != "regex":
+        # The pattern is only used by the regex tokenizer
+        del relevant_options["pattern"]
+    if not options["approx"]:
+        # The error is only that of the sketches of --approx
+        del relevant_options["error"]
+    if "o" in modes and "u" not in modes and not options["approx"] and not options["incremental"]:
+        # The occurrences of whole files may only hold the words selected by --top and --min-count, see run_task
+        relevant_options.update(top=options["top"], min_count=options["min_count"])
+    if options["stopwords"]:
+        # The stopwords file may be edited or given by another relative path
+        relevant_options["stopwords"] = file_identity(options["stopwords"])
+    relevant_options = sorted(relevant_options.items())
+    if options["incremental"]:
+        key = repr((CACHE_FORMAT, os.path.realpath(file), stat.st_ino, modes, relevant_options))
+    else:
+        key = repr((CACHE_FORMAT, os.path.realpath(file), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                    modes, relevant_options))
+    return os.path.join(options["cache"], hashlib.sha1(key.encode()).hexdigest() + ".pickle")
+
+
+def load_cached(entry: str) -> object:
+    """
+    Loads a result from the cache, marking it as recently used.
+
+    Requires:
+    entry (str): The path of an entry of the cache, as given by cache_entry.
+    Ensures:
+    Returning the stored result, or None if there is no such entry or it cannot be read.
+    """
+    try:
+        with open(entry, 'rb') as f:
+            result = pickle.load(f)
+        # The modification time of an entry is the time it was last used
+        os.utime(entry)
+        return result
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def store_cached(entry: str, result: object) -> None:
+    """
+    Stores a result in the cache.
+
+    Requires:
+    entry (str): The path of an entry of the cache, as given by cache_entry.
+    result (object): The result of the file, a dict mapping every mode to its result (see new_partial).
+    Ensures:
+    Writing the result to the entry, atomically, so that concurrent runs never read a partial entry.
+    """
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    temporary = f"{entry}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, entry)
+
+
+def calc_fingerprint(file: str, offset: int) -> str:
+    """
+    Returns a hash of the start of a text file, up to a given offset.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    offset (int): The offset up to which the file is hashed, at most FINGERPRINT_SIZE bytes are read.
+    Ensures:
+    Returning the hexadecimal SHA-1 of the first min(offset, FINGERPRINT_SIZE) bytes of the file.
+    """
+    with open(file, 'rb') as f:
+        return hashlib.sha1(f.read(min(offset, FINGERPRINT_SIZE))).hexdigest()
+
+
+def load_progress(file: str, entry: str) -> tuple:
+    """
+    Loads the progress of --incremental for a text file: how far it was counted, and its result up to there.
+    A file that got smaller, or whose first bytes changed (e.g. rotated or rewritten in place), is counted from the start.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    entry (str): The path of the entry of the file in the cache, as given by cache_entry.
+    Ensures:
+    Returning a tuple (offset, result), where result is the result of the bytes before offset,
+    or (0, None) if the file has no usable progress.
+    """
+    progress = load_cached(entry)
+    if progress is None or progress["offset"] > calc_size(file):
+        return 0, None
+    if calc_fingerprint(file, progress["offset"]) != progress["fingerprint"]:
+        return 0, None
+    return progress["offset"], progress["result"]
+
+
+def store_progress(file: str, entry: str, offset: int, result: object) -> None:
+    """
+    Stores the progress of --incremental for a text file.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    entry (str): The path of the entry of the file in the cache, as given by cache_entry.
+    offset (int): The offset up to which the file was counted, the offset of a whitespace byte or 0.
+    result (object): The result of the bytes before offset.
+    Ensures:
+    Storing the progress in the cache, to be loaded by load_progress in the next run.
+    """
+    store_cached(entry, {"offset": offset, "fingerprint": calc_fingerprint(file, offset), "result": result})
+
+
+def evict_cache(options: dict) -> None:
+    """
+    Evicts the least recently used entries of the cache until it fits in its maximum size.
+
+    Requires:
+    options (dict): The --name=value options given to pwordcount, with a cache directory.
+    Ensures:
+    Removing the entries used longest ago while the entries of the cache directory
+    take more than options["cache_size"] MiB.
+    """
+    entries = []
+    with os.scandir(options["cache"]) as directory:
+        for item in directory:
+            if item.name.endswith(".pickle"):
+                stat = item.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+
+    excess = sum(size for _, size, _ in entries) - options["cache_size"] * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if excess <= 0:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already evicted by a concurrent run
+            pass
+        excess -= size
+
+
+def select_occurrences(word_counts: Counter, options: dict) -> list:
+    """
+    Selects the words listed by mode -m o, sorted by decreasing number of occurrences, then alphabetically.
+
+    Requires:
+    word_counts (Counter): The occurrences of each word.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a list of (word, occurences) tuples for the words with at least options["min_count"] occurrences,
+    limited to the options["top"] most frequent ones, found with a heap, if given.
+    """
+    items = word_counts.items()
+    if options["min_count"] > 1:
+        items = [(word, occurences) for word, occurences in items if occurences >= options["min_count"]]
+
+    if options["top"] is not None:
+        return heapq.nsmallest(options["top"], items, key=lambda item: (-item[1], item[0]))
+    # Two stable sorts, by word then by occurrences, are faster than a single sort on a composite key
+    selection = sorted(items)
+    selection.sort(key=itemgetter(1), reverse=True)
+    return selection
+
+
+def select_packed(vocabulary: Vocabulary, options: dict):
+    """
+    Selects the words of a Vocabulary of mode -m o listed by mode -m o, as select_occurrences does,
+    without decoding them: words in valid UTF-8 sort as their decoded str do. The words are sorted by id,
+    so that only the list of the words and the list of the selected ids are built, not a tuple per word.
+
+    Requires:
+    vocabulary (Vocabulary): The occurrences of each word, with counts.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Yielding (word, occurences) tuples in the order of select_occurrences, where word is still encoded (bytes).
+    If the words are not valid UTF-8, they are decoded and selected by select_occurrences, then encoded again,
+    since invalid words may decode to the same str.
+    """
+    if not is_utf8(vocabulary.words):
+        for word, occurences in select_occurrences(unpack_vocabulary(vocabulary), options):
+            yield word.encode(), occurences
+        return
+
+    words, counts = split_vocabulary(vocabulary), vocabulary.counts
+    ids = range(len(words))
+    if options["min_count"] > 1:
+        ids = [word_id for word_id in ids if counts[word_id] >= options["min_count"]]
+    if options["top"] is not None:
+        ids = heapq.nsmallest(options["top"], ids, key=lambda word_id: (-counts[word_id], words[word_id]))
+    else:
+        # Two stable sorts, as in select_occurrences
+        ids = sorted(ids, key=words.__getitem__)
+        ids.sort(key=counts.__getitem__, reverse=True)
+    for word_id in ids:
+        yield words[word_id], counts[word_id]
+
+
+def select_vocabulary(vocabulary: Vocabulary, options: dict) -> Vocabulary:
+    """
+    Reduces the Vocabulary of mode -m o of a whole file to the words listed by mode -m o.
+
+    Requires:
+    vocabulary (Vocabulary): The occurrences of each word of the file.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a Vocabulary of the words chosen by select_packed, in the order of the list.
+    """
+    return pack_vocabulary(Counter(dict(select_packed(vocabulary, options))))
+
+
+def print_occurrences(file: str, word_counts: object, file_size: int, options: dict, title: str = None) -> None:
+    """
+    Prints the result of mode -m o for a text file.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    word_counts (object): The occurrences of each word in the file, a Counter or a Vocabulary.
+    file_size (int): The size of the file in bytes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    title (str): The line printed before the list, the number of occurrences of each word by default.
+    Ensures:
+    Printing the number of occurrences of the words chosen by select_occurrences, or select_packed for a Vocabulary,
+    followed by the size of the file. The words of a Vocabulary are decoded as they are printed,
+    and the list is written OUTPUT_LINES lines at a time rather than one print per word.
+    """
+    print(title or f'Number of occurrences of each word in "{file}":')
+    if isinstance(word_counts, Vocabulary):
+        selection = ((word.decode('utf-8', errors='replace'), occurences)
+                     for word, occurences in select_packed(word_counts, options))
+    else:
+        selection = select_occurrences(word_counts, options)
+    lines = (f"{word}: {occurences} time" if occurences == 1 else f"{word}: {occurences} times"
+             for word, occurences in selection)
+    while True:
+        chunk = list(islice(lines, OUTPUT_LINES))
+        if not chunk:
+            break
+        sys.stdout.write("\n".join(chunk) + "\n")
+    print("• End of list •")
+    print(f'Size of "{file}": {file_size} bytes.')
+
+
+def start_file(file: str, modes: str, options: dict) -> tuple:
+    """
+    Prepares the processing of a text file with the cache.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a tuple (entry, start_byte, end_byte, base), where the bytes from start_byte to end_byte
+    are left to process, and base is the result of the bytes before start_byte, or None if there are none.
+    entry is the path of the entry of the file in the cache, or None without a cache directory.
+    If the result of the file is cached, entry is None and base is that result: there is nothing left to do.
+    With --incremental, the range starts where the last run stopped and ends at the last whitespace of the file.
+    """
+    file_size = calc_size(file)
+    if not options["cache"]:
+        return None, 0, file_size, None
+
+    entry = cache_entry(file, modes, options)
+    if options["incremental"]:
+        start_byte, base = load_progress(file, entry)
+        return entry, start_byte, find_last_boundary(file, start_byte, file_size), base
+
+    result = load_cached(entry)
+    if result is not None:
+        return None, file_size, file_size, result
+    return entry, 0, file_size, None
+
+
+def finish_file(file: str, modes: str, options: dict, entry: str, end_byte: int, base: dict, result: dict) -> dict:
+    """
+    Completes the result of a text file processed up to a given offset, and updates the cache.
+
+    Requires:
+    file (str): str indicating a text file's directory.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    entry, end_byte, base: The values given by start_file for the file.
+    result (dict): The result of the bytes processed, from start_byte to end_byte.
+    Ensures:
+    Returning the result of the whole file, and storing it in the cache, or with --incremental
+    storing the result up to end_byte and adding the last word of the file to the returned result.
+    """
+    if base is not None:
+        result = merge_partials(base, result, options)
+
+    if entry and options["incremental"]:
+        store_progress(file, entry, end_byte, result)
+        # The last word may still be incomplete, it is counted again in the next run
+        result = merge_partials(result, count_range(file, end_byte, calc_size(file), modes, options), options)
+    elif entry:
+        store_cached(entry, result)
+
+    return result
+
+
+@dataclass
+class Result:
+    """
+    The result of pwordcount for a file, as returned by count.
+
+    file (str): The path of the file, or "-" for the standard input.
+    size (int): The size of the file in bytes, or the number of bytes read from a stream.
+    total (int): The number of words (mode "t"), or None if it was not computed.
+    unique (Vocabulary): The unique words (mode "u"), still encoded, or None if they were not computed;
+    with --approx a HyperLogLog, see unique_count. With mode "o", it is the Vocabulary of occurrences.
+    occurrences (Vocabulary): The occurrences of each word (mode "o"), still encoded, or None if they were not computed;
+    with --approx a Count-Min Sketch, see word_counts.
+    parts (int): The number of parts of the file whose results were merged, 0 if the result was cached.
+    merge_time (float): The time spent merging the results of the parts in seconds, or None if it was not measured.
+    """
+    file: str
+    size: int
+    total: int = None
+    unique: object = None
+    occurrences: object = None
+    parts: int = 1
+    merge_time: float = None
+
+    def unique_count(self) -> int:
+        """
+        Returns the number of unique words of the file, exact or estimated with --approx.
+        """
+        if isinstance(self.unique, Vocabulary):
+            return vocabulary_size(self.unique)
+        return estimate_hyperloglog(self.unique)
+
+    def unique_words(self) -> set:
+        """
+        Returns the unique words of the file, decoded, or None with --approx, which does not keep them.
+        """
+        if isinstance(self.unique, Vocabulary):
+            return set(unpack_vocabulary(self.unique))
+        return None
+
+    def word_counts(self) -> Counter:
+        """
+        Returns the occurrences of each word of the file, exact or, with --approx, estimated for the most frequent words.
+        The words are decoded on every call.
+        """
+        if isinstance(self.occurrences, Vocabulary):
+            return unpack_vocabulary(self.occurrences)
+        return sketch_occurrences(self.occurrences)
+
+
+def make_result(file: str, partial: dict, file_size: int, parts: int, merge_time: float = None) -> Result:
+    """
+    Builds the Result of a file from its merged partial result.
+
+    Requires:
+    file (str): str indicating a file's directory, or "-" for the standard input.
+    partial (dict): The result of the whole file, as given by finish_file or merge_partials.
+    file_size (int): The size of the file in bytes.
+    parts (int): The number of parts of the file whose results were merged.
+    merge_time (float): The time spent merging them in seconds, None if it was not measured.
+    Ensures:
+    Returning a Result holding the result of every mode of partial. The words of every Vocabulary are left packed
+    until they are printed, and their indexes are dropped: nothing is merged into them anymore.
+    """
+    unique, occurrences = partial.get("u"), partial.get("o")
+    if "u" in partial and unique is None:
+        # The unique words are those of mode "o", see new_partial
+        unique = occurrences
+    for result in (unique, occurrences):
+        if isinstance(result, Vocabulary):
+            result.index = None
+    return Result(file, file_size, partial.get("t"), unique, occurrences, parts, merge_time)
+
+
+def print_result(result: Result, options: dict) -> None:
+    """
+    Prints the result of every computed mode for a text file.
+
+    Requires:
+    result (Result): The result of the file.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Printing the result in the format of each mode, in the order of MODES, along with the error bounds of estimates.
+    """
+    file, file_size = result.file, result.size
+    if result.total is not None:
+        print(
+            f'The file "{file}" has {result.total} words, and a total size of {file_size} bytes.')
+    if result.unique is not None and options["approx"]:
+        error = 1.04 / math.sqrt(len(result.unique))
+        print(
+            f'The file "{file}" has about {result.unique_count()} unique words (standard error {error:.2%}), and a total size of {file_size} bytes.')
+    elif result.unique is not None:
+        print(
+            f'The file "{file}" has {result.unique_count()} unique words, and a total size of {file_size} bytes.')
+    if result.occurrences is not None and options["approx"]:
+        bound = math.floor(options["error"] * result.occurrences["total"])
+        print_occurrences(file, result.word_counts(), file_size, options,
+                          f'Estimated number of occurrences of the most frequent words in "{file}" (at most {bound} too high, with probability {1 - SKETCH_FAILURE_PROBABILITY:.0%}):')
+    elif result.occurrences is not None:
+        print_occurrences(file, result.occurrences, file_size, options)
+
+
+def run_task(task: tuple) -> tuple:
+    """
+    Runs a task of divide_between or divide_one_file in a worker of the pool.
+
+    Requires:
+    task (tuple): A tuple (index, part, modes, file, compression, unit, options, select),
+    where index identifies the file in the list given to divide_between, part is the number of the task among
+    the tasks of the file, and unit is a byte range (start_byte, end_byte) of an uncompressed file,
+    or with a compression format, a unit of the compressed file as given by find_units.
+    select tells whether the byte range is a whole file of mode -m o, without mode -m u.
+    Ensures:
+    Returning a tuple (index, part, partial, fragment, events), where partial is the result of count_range
+    for the byte range, or the result of scan_fragment for the unit, with the fragment of the unit,
+    fragment is None for uncompressed files, and events is the list of trace events of the task with --stats,
+    None otherwise (see trace_event).
+    The units of compressed files are counted in the worker itself, whatever the engine given by --engine.
+    If the unit turns out not to be decompressible on its own, partial and fragment are None.
+    If select is True, the Vocabulary of mode "o" only keeps the words chosen by select_occurrences, so that the words
+    left out of the list (e.g. by --top) are not sent back to the parent.
+    A range that is only a part of a file is returned whole, since the words left out of the list of a part
+    may be among the most frequent of the whole file.
+    """
+    index, part, modes, file, compression, unit, options, select = task
+    start = time.perf_counter()
+    # With --stats, the words are counted along with the other modes
+    scan_modes = modes if not options["stats"] or "t" in modes else "t" + modes
+    fragment = None
+    if compression is None:
+        partial = count_range(file, unit[0], unit[1], scan_modes, options)
+        num_bytes = unit[1] - unit[0]
+    else:
+        try:
+            partial, fragment, num_bytes = scan_fragment(decompress_unit(file, compression, unit), scan_modes, options)
+        except DECOMPRESSION_ERRORS:
+            if unit is None:
+                raise
+            return index, part, None, None, None
+    words = partial["t"] if "t" in modes else partial.pop("t", None)
+    if select:
+        partial["o"] = select_vocabulary(partial["o"], options)
+
+    if not options["stats"]:
+        return index, part, partial, fragment, None
+    events = []
+    trace_event(events, "count", start, file=file, bytes=num_bytes, words=words)
+    return index, part, partial, fragment, events
+
+
+def trace_event(events: list, name: str, start: float, end: float = None, **args) -> None:
+    """
+    Records a phase of the run for --stats, as a complete event of the Chrome trace event format.
+
+    Requires:
+    events (list): The trace events of the run, or None without --stats.
+    name (str): The name of the phase, e.g. "count" or "merge".
+    start (float): The time.perf_counter() time at which the phase started.
+    end (float): The time.perf_counter() time at which the phase ended, now by default.
+    args: Details of the phase, such as the file, bytes and words.
+    Ensures:
+    Appending the event to events, on the timeline of the current process, or nothing if events is None.
+    """
+    if events is None:
+        return
+    if end is None:
+        end = time.perf_counter()
+    events.append({"name": name, "ph": "X", "ts": start * 1e6, "dur": (end - start) * 1e6,
+                   "pid": os.getpid(), "tid": os.getpid(), "args": args})
+
+
+def trace_tasks(events: list, task_events: list, received: float, pool_start: float = None, dispatched: float = None, workers: set = None) -> None:
+    """
+    Records the trace events returned by a worker for --stats, with the time spent around the task:
+    the time its result took to reach the parent and, with a pool, the time it waited to be taken by a worker,
+    or for the first task of a worker, the time the worker took to start.
+
+    Requires:
+    events (list): The trace events of the run, or None without --stats.
+    task_events (list): The trace events returned by run_task or process_block.
+    received (float): The time.perf_counter() time at which the parent got the result of the task.
+    pool_start (float): The time.perf_counter() time at which the pool was created, None without a pool.
+    dispatched (float): The time.perf_counter() time at which the task was handed to the pool, None without a pool.
+    workers (set): The process ids of the workers that already ran a task, updated with the worker of the task.
+    Ensures:
+    Appending task_events to events, the first event having the waiting times in seconds in its details:
+    "transfer", and "spawn" or "queue_wait" with a pool.
+    """
+    if events is None:
+        return
+    event = task_events[0]
+    start = event["ts"] / 1e6
+    event["args"]["transfer"] = received - start - event["dur"] / 1e6
+    if pool_start is not None:
+        if event["pid"] in workers:
+            event["args"]["queue_wait"] = max(start - dispatched, 0.0)
+        else:
+            workers.add(event["pid"])
+            event["args"]["spawn"] = start - pool_start
+    events.extend(task_events)
+
+
+def print_stats(events: list, wall_time: float) -> None:
+    """
+    Prints the summary of --stats.
+
+    Requires:
+    events (list): The trace events of the run.
+    wall_time (float): The duration of the run in seconds.
+    Ensures:
+    Printing the number, total, mean and maximum duration of every phase, the bytes and words counted,
+    the work of every process, and the mean and maximum process spawn latency, queue wait and result transfer times.
+    """
+    phases = {}
+    for event in events:
+        phases.setdefault(event["name"], []).append(event["dur"] / 1e6)
+
+    print()
+    print(f"Statistics of the run, in {wall_time:.6f} seconds:")
+    print(f"{'Phase':<14}{'Events':>8}{'Total (s)':>14}{'Mean (s)':>14}{'Max (s)':>14}")
+    for name, durations in phases.items():
+        print(f"{name:<14}{len(durations):>8}{sum(durations):>14.6f}{sum(durations) / len(durations):>14.6f}{max(durations):>14.6f}")
+
+    counts = [event for event in events if event["name"] == "count"]
+    num_bytes = sum(event["args"]["bytes"] for event in counts)
+    num_words = sum(event["args"]["words"] for event in counts)
+    busy = sum(event["dur"] for event in counts) / 1e6
+    print(f"Counted {num_bytes} bytes and {num_words} words in {len(counts)} tasks", end="")
+    print(f", {num_bytes / 1e6 / busy:.3f} MB/s and {num_words / busy:.0f} words/s per process." if busy else ".")
+
+    workers = {}
+    for event in counts:
+        workers.setdefault(event["pid"], []).append(event)
+    for pid, tasks in workers.items():
+        print(f"Process {pid}: {len(tasks)} tasks in {sum(event['dur'] for event in tasks) / 1e6:.6f} seconds, "
+              f"{sum(event['args']['bytes'] for event in tasks)} bytes, {sum(event['args']['words'] for event in tasks)} words")
+
+    for name, title in (("spawn", "Process spawn latency"), ("queue_wait", "Queue wait"), ("transfer", "Result transfer")):
+        times = [event["args"][name] for event in counts if name in event["args"]]
+        if times:
+            print(f"{title}: {sum(times) / len(times):.6f} seconds on average, {max(times):.6f} at most, over {len(times)} tasks")
+
+
+def write_trace(events: list, file: str) -> None:
+    """
+    Writes the trace of --trace, loadable in the Chrome trace viewer (chrome://tracing) and Perfetto.
+
+    Requires:
+    events (list): The trace events of the run.
+    file (str): str indicating the directory of the trace file.
+    Ensures:
+    Writing events as a JSON trace, with the parent process named "pwordcount" and the others "worker".
+    """
+    names = [{"name": "process_name", "ph": "M", "pid": pid, "tid": pid,
+              "args": {"name": "pwordcount" if pid == os.getpid() else "worker"}}
+             for pid in sorted({event["pid"] for event in events})]
+    with open(file, 'w') as f:
+        json.dump({"traceEvents": names + events, "displayTimeUnit": "ms"}, f)
+
+
+def is_stream(file: str) -> bool:
+    """
+    Tells whether a file can only be read as a stream: the standard input, given as "-",
+    or anything that is not a regular file, such as a named pipe.
+
+    Requires:
+    file (str): str indicating a file's directory, or "-".
+    Ensures:
+    Returning True if the file cannot be sized, seeked or divided into byte ranges.
+    """
+    return file == "-" or not stat.S_ISREG(os.stat(file).st_mode)
+
+
+class PushbackStream:
+    """
+    A binary stream reading bytes already read from another stream, pushed back in front of it, then the rest of it.
+    Closing it does not close the other stream.
+
+    prefix (bytes): The bytes pushed back, read first.
+    stream: The binary file object read after them.
+    """
+
+    def __init__(self, prefix: bytes, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b""
+        else:
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data
+
+    def close(self) -> None:
+        pass
+
+
+def read_header(stream, size: int) -> bytes:
+    """
+    Reads the first bytes of a stream, such as a pipe, whose reads may return fewer bytes than asked for.
+
+    Requires:
+    stream: A binary file object.
+    size (int): The number of bytes to read.
+    Ensures:
+    Returning the first size bytes of the stream, or all of them if the stream is shorter.
+    """
+    header = b""
+    while len(header) < size:
+        data = stream.read(size - len(header))
+        if not data:
+            break
+        header += data
+    return header
+
+
+def read_stream(file: str):
+    """
+    Reads a stream in blocks of about BLOCK_SIZE bytes.
+
+    Requires:
+    file (str): str indicating a file's directory, or "-" for the standard input.
+    Ensures:
+    Yielding the stream in blocks (bytes), each one ending on a whitespace byte or at the end of the stream,
+    so that no word is split between two blocks. Only one block is held in memory at a time.
+    A stream compressed with gzip, bzip2 or xz, detected by its magic bytes, is decompressed as it is read.
+    """
+    stream = sys.stdin.buffer if file == "-" else open(file, 'rb')
+    # The magic bytes are read whole, even if they arrive in several writes, and pushed back in front of the stream
+    header = read_header(stream, 6)
+    source = PushbackStream(header, stream)
+    try:
+        compression = detect_compression(header)
+        if compression:
+            source = open_decompressed(source, compression)
+        carry = b""
+        while True:
+            block = source.read(BLOCK_SIZE)
+            if not block:
+                break
+            # Cut the block after its last whitespace byte, the rest goes to the next block
+            cut = max(block.rfind(c) for c in WHITESPACE_BYTES) + 1
+            if cut == 0:
+                carry += block
+                continue
+            yield carry + block[:cut]
+            carry = block[cut:]
+        if carry:
+            yield carry
+    finally:
+        source.close()
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+def detect_compression(header: bytes) -> str:
+    """
+    Detects the compression format of a file from its first bytes.
+
+    Requires:
+    header (bytes): The first bytes of a file, at least 6 to detect every format.
+    Ensures:
+    Returning "gzip", "bz2" or "xz" if header starts with the magic bytes of that format, None otherwise.
+    """
+    for magic, compression in COMPRESSION_MAGIC:
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def file_compression(file: str) -> str:
+    """
+    Detects the compression format of a regular file from its magic bytes, whatever its name.
+
+    Requires:
+    file (str): str indicating a file's directory.
+    Ensures:
+    Returning "gzip", "bz2" or "xz" if the file is compressed in that format, None otherwise.
+    """
+    with open(file, 'rb') as f:
+        return detect_compression(f.read(6))
+
+
+def open_decompressed(stream, compression: str):
+    """
+    Opens a decompressing reader over a compressed stream.
+
+    Requires:
+    stream: A binary file object positioned at the start of the compressed data.
+    compression (str): The compression format of the stream: "gzip", "bz2" or "xz".
+    Ensures:
+    Returning a binary file object reading the decompressed data of every member or stream in turn,
+    which does not close stream when it is closed.
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=stream)
+    elif compression == "bz2":
+        return bz2.BZ2File(stream)
+    else:
+        return lzma.LZMAFile(stream)
+
+
+def read_bits(data, bit: int, num_bits: int) -> int:
+    """
+    Reads a number of bits at any bit offset, the most significant bit of a byte coming first.
+
+    Requires:
+    data: The bytes to read, as bytes or a memory map.
+    bit (int): The offset of the first bit to read.
+    num_bits (int): The number of bits to read, whose last one lies in data.
+    Ensures:
+    Returning the bits read, as an int.
+    """
+    start, end = bit // 8, (bit + num_bits + 7) // 8
+    value = int.from_bytes(data[start:end], 'big')
+    return (value >> ((end - start) * 8 - bit % 8 - num_bits)) & ((1 << num_bits) - 1)
+
+
+def find_bits(data, magic: int) -> list:
+    """
+    Finds a 48-bit magic number of bzip2 at any bit offset.
+    For each of the 8 possible offsets of its first bit in a byte, the bytes it fully covers are searched for,
+    and every match is checked bit by bit.
+
+    Requires:
+    data: The bytes to search, as bytes or a memory map.
+    magic (int): The 48-bit magic number.
+    Ensures:
+    Returning the sorted list of the bit offsets where magic is found.
+    """
+    positions = []
+    for shift in range(8):
+        pattern = (magic << (8 - shift)).to_bytes(7, 'big')
+        first = 1 if shift else 0
+        found = data.find(pattern[first:6])
+        while found != -1:
+            bit = (found - first) * 8 + shift
+            if bit >= 0 and bit + 48 <= len(data) * 8 and read_bits(data, bit, 48) == magic:
+                positions.append(bit)
+            found = data.find(pattern[first:6], found + 1)
+    return sorted(positions)
+
+
+def find_gzip_members(data) -> list:
+    """
+    Divides a gzip file into groups of whole members, as written by pigz, bgzip or by concatenating gzip files.
+    Members are found by their headers; candidates with reserved flags or unknown values are left out,
+    and a candidate that is not a member boundary after all is detected when its range is decompressed.
+
+    Requires:
+    data: The contents of the gzip file, as bytes or a memory map.
+    Ensures:
+    Returning a list of byte ranges (start_byte, end_byte) covering the file, each one starting at a member header
+    and holding at least COMPRESSED_TASK_SIZE bytes, except the last one.
+    """
+    starts = []
+    position = data.find(b"\x1f\x8b\x08")
+    while position != -1:
+        header = data[position:position + 10]
+        if len(header) == 10 and header[3] & 0xE0 == 0 and header[8] in (0, 2, 4) and (header[9] <= 13 or header[9] == 255):
+            starts.append(position)
+        position = data.find(b"\x1f\x8b\x08", position + 1)
+
+    if not starts or starts[0] != 0:
+        return [None]
+    ranges = []
+    begin = 0
+    for start in starts[1:]:
+        if start - begin >= COMPRESSED_TASK_SIZE:
+            ranges.append((begin, start))
+            begin = start
+    ranges.append((begin, len(data)))
+    return ranges
+
+
+def find_bz2_blocks(data) -> list:
+    """
+    Divides a bzip2 file into its blocks, which bzip2 compresses independently, by their magic numbers.
+
+    Requires:
+    data: The contents of the bzip2 file, as bytes or a memory map.
+    Ensures:
+    Returning a list of tuples of consecutive blocks, each holding at least COMPRESSED_TASK_SIZE bytes except the last one,
+    where a block is given by its bit range (start_bit, end_bit), from its magic number to the magic number that follows it.
+    """
+    magics = sorted([(bit, True) for bit in find_bits(data, BZ2_BLOCK_MAGIC)]
+                    + [(bit, False) for bit in find_bits(data, BZ2_END_MAGIC)])
+    blocks = [(bit, next_bit) for (bit, is_block), (next_bit, _) in zip(magics, magics[1:]) if is_block]
+    units = []
+    for block in blocks:
+        if units and (units[-1][-1][1] - units[-1][0][0]) // 8 < COMPRESSED_TASK_SIZE:
+            units[-1] += (block,)
+        else:
+            units.append((block,))
+    return units or [None]
+
+
+def read_varint(data, position: int) -> tuple:
+    """
+    Reads a variable-length integer of the xz format.
+
+    Requires:
+    data: The bytes to read, as bytes or a memory map.
+    position (int): The offset of the integer.
+    Ensures:
+    Returning a tuple (value, next_position).
+    """
+    value = shift = 0
+    while True:
+        byte = data[position]
+        value |= (byte & 0x7F) << shift
+        position += 1
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def write_varint(value: int) -> bytes:
+    """
+    Writes a variable-length integer of the xz format.
+
+    Requires:
+    value (int): A non-negative int.
+    Ensures:
+    Returning the encoded integer.
+    """
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def find_xz_blocks(data) -> list:
+    """
+    Divides an xz file into its blocks, as written by xz -T, from the index at the end of every stream.
+
+    Requires:
+    data: The contents of the xz file, as bytes or a memory map.
+    Ensures:
+    Returning a list of tuples (header, start_byte, unpadded_size, uncompressed_size), one per block of every stream,
+    where header is the header of the stream of the block, or [None] if the file cannot be divided.
+    """
+    blocks = []
+    position = len(data)
+    try:
+        while position > 0:
+            # Streams may be followed by padding
+            while position >= 4 and data[position - 4:position] == b"\x00\x00\x00\x00":
+                position -= 4
+            footer = data[position - 12:position]
+            if footer[10:12] != b"YZ":
+                return [None]
+            index_start = position - 12 - (int.from_bytes(footer[4:8], 'little') + 1) * 4
+            if data[index_start] != 0:
+                return [None]
+            num_records, cursor = read_varint(data, index_start + 1)
+            records = []
+            for _ in range(num_records):
+                unpadded_size, cursor = read_varint(data, cursor)
+                uncompressed_size, cursor = read_varint(data, cursor)
+                records.append((unpadded_size, uncompressed_size))
+            stream_start = index_start - sum(-(-unpadded_size // 4) * 4 for unpadded_size, _ in records) - 12
+            header = bytes(data[stream_start:stream_start + 12])
+            if stream_start < 0 or not header.startswith(b"\xfd7zXZ\x00"):
+                return [None]
+            start_byte = stream_start + 12
+            stream_blocks = []
+            for unpadded_size, uncompressed_size in records:
+                stream_blocks.append((header, start_byte, unpadded_size, uncompressed_size))
+                start_byte += -(-unpadded_size // 4) * 4
+            blocks = stream_blocks + blocks
+            position = stream_start
+    except IndexError:
+        return [None]
+    return blocks or [None]
+
+
+def find_units(file: str, compression: str) -> list:
+    """
+    Divides a compressed file into units that can be decompressed independently, by different processes.
+
+    Requires:
+    file (str): str indicating a compressed file's directory.
+    compression (str): The compression format of the file: "gzip", "bz2" or "xz".
+    Ensures:
+    Returning the units of the file, in order: byte ranges of whole gzip members, groups of bzip2 blocks
+    or xz blocks (see find_gzip_members, find_bz2_blocks and find_xz_blocks),
+    or [None] if the file is a single unit, decompressed as a whole.
+    """
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if compression == "gzip":
+            return find_gzip_members(data)
+        elif compression == "bz2":
+            return find_bz2_blocks(data)
+        else:
+            return find_xz_blocks(data)
+
+
+def decompress_chunks(decompressor, data: bytes):
+    """
+    Decompresses a whole bzip2 or xz stream, BLOCK_SIZE bytes at a time.
+
+    Requires:
+    decompressor: A new bz2.BZ2Decompressor or lzma.LZMADecompressor.
+    data (bytes): The compressed stream.
+    Ensures:
+    Yielding the decompressed data in chunks of at most BLOCK_SIZE bytes.
+    Raising EOFError if the stream is incomplete.
+    """
+    yield decompressor.decompress(data, max_length=BLOCK_SIZE)
+    while not decompressor.eof and not decompressor.needs_input:
+        yield decompressor.decompress(b"", max_length=BLOCK_SIZE)
+    if not decompressor.eof:
+        raise EOFError("compressed unit ended before the end of its stream")
+
+
+def decompress_unit(file: str, compression: str, unit: tuple):
+    """
+    Decompresses a unit of a compressed file, as given by find_units.
+    A bzip2 block is made into a stream of its own, with a header, the end of stream magic number and the CRC of the block;
+    an xz block is made into a stream of its own with the header of its stream, an index and a footer.
+
+    Requires:
+    file (str): str indicating a compressed file's directory.
+    compression (str): The compression format of the file: "gzip", "bz2" or "xz".
+    unit (tuple): A unit of the file, or None to decompress the whole file.
+    Ensures:
+    Yielding the decompressed data of the unit, in chunks.
+    Raising an error of DECOMPRESSION_ERRORS if the unit cannot be decompressed on its own.
+    """
+    with open(file, 'rb') as f:
+        if unit is None:
+            with open_decompressed(f, compression) as stream:
+                while True:
+                    chunk = stream.read(BLOCK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        elif compression == "gzip":
+            start_byte, end_byte = unit
+            f.seek(start_byte)
+            decompressor = None
+            while start_byte < end_byte:
+                chunk = f.read(min(BLOCK_SIZE, end_byte - start_byte))
+                start_byte += len(chunk)
+                while chunk:
+                    if decompressor is None:
+                        decompressor = zlib.decompressobj(31)
+                    yield decompressor.decompress(chunk)
+                    if not decompressor.eof:
+                        break
+                    # End of a member, the rest of the chunk starts the next one
+                    chunk = decompressor.unused_data
+                    decompressor = None
+            if decompressor is not None:
+                raise EOFError("gzip unit ended in the middle of a member")
+
+        elif compression == "bz2":
+            for start_bit, end_bit in unit:
+                f.seek(start_bit // 8)
+                data = f.read((end_bit + 7) // 8 - start_bit // 8)
+                num_bits = end_bit - start_bit
+                block = read_bits(data, start_bit % 8, num_bits)
+                # The CRC of the block follows its magic number, it is also the CRC of a stream of this block only
+                block_crc = (block >> (num_bits - 80)) & 0xFFFFFFFF
+                stream = (((int.from_bytes(b"BZh9", 'big') << num_bits | block) << 48 | BZ2_END_MAGIC) << 32) | block_crc
+                num_bits += 32 + 48 + 32
+                padding = -num_bits % 8
+                yield from decompress_chunks(bz2.BZ2Decompressor(),
+                                             (stream << padding).to_bytes((num_bits + padding) // 8, 'big'))
+
+        else:
+            header, start_byte, unpadded_size, uncompressed_size = unit
+            f.seek(start_byte)
+            block = f.read(-(-unpadded_size // 4) * 4)
+            index = b"\x00" + write_varint(1) + write_varint(unpadded_size) + write_varint(uncompressed_size)
+            index += b"\x00" * (-len(index) % 4)
+            index += zlib.crc32(index).to_bytes(4, 'little')
+            backward_size = (len(index) // 4 - 1).to_bytes(4, 'little')
+            footer = zlib.crc32(backward_size + header[6:8]).to_bytes(4, 'little') + backward_size + header[6:8] + b"YZ"
+            yield from decompress_chunks(lzma.LZMADecompressor(lzma.FORMAT_XZ), header + block + index + footer)
+
+
+def scan_fragment(chunks, modes: str, options: dict) -> tuple:
+    """
+    Computes the given modes for the decompressed data of a unit of a compressed file.
+    The units of a file may split words, so the bytes before the first whitespace and after the last one
+    are left out, to be joined with the neighbouring units by stitch_fragments.
+
+    Requires:
+    chunks (iterable): The decompressed data of the unit, as given by decompress_unit.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a tuple (partial, fragment, size), where partial is the partial result of the whole words of the unit,
+    packed by pack_partial, size is the number of decompressed bytes,
+    and fragment is a tuple (head, tail, has_whitespace) of the bytes before the first whitespace and after the last one;
+    without any whitespace, head holds the whole unit and tail is empty.
+    """
+    partial = new_partial(modes, options)
+    head = None
+    carry = b""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        data = carry + chunk
+        if head is None:
+            first = WHITESPACE.search(data)
+            if first is None:
+                carry = data
+                continue
+            head, data = data[:first.start()], data[first.start():]
+        cut = max(data.rfind(c) for c in WHITESPACE_BYTES) + 1
+        block, carry = data[:cut], data[cut:]
+        if modes == "t":
+            partial["t"] += count_tokens(block, options)
+        else:
+            scan_words(partial, [block.split()], options)
+
+    pack_partial(partial, options)
+    if head is None:
+        return partial, (carry, b"", False), size
+    return partial, (head, carry, True), size
+
+
+def stitch_fragments(fragments: list) -> list:
+    """
+    Joins the words split between the units of a compressed file.
+
+    Requires:
+    fragments (list): The fragments of every unit of the file, in order, as given by scan_fragment.
+    Ensures:
+    Returning the list of words (bytes) formed by the tail of every unit and the head of the next one,
+    including the head of the first unit and the tail of the last one.
+    """
+    words = []
+    carry = b""
+    for head, tail, has_whitespace in fragments:
+        carry += head
+        if has_whitespace:
+            if carry:
+                words.append(carry)
+            carry = tail
+    if carry:
+        words.append(carry)
+    return words
+
+
+def finish_units(partial: dict, fragments: list, modes: str, options: dict) -> dict:
+    """
+    Completes the result of a compressed file from the merged partial results of its units.
 
     Requires:
-    file (str): str indicating a text file's directory.
+    partial (dict): The merge of the partial results of every unit of the file, as given by scan_fragment.
+    fragments (list): The fragments of every unit of the file, in order.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
     Ensures:
-    Returning the bytes size of a given file as an integer.
+    Returning the result of the whole file, with the words split between units.
     """
-    return os.path.getsize(file)
+    stitched = scan_words(new_partial(modes, options), [stitch_fragments(fragments)], options)
+    return merge_partials(partial, pack_partial(stitched, options), options)
+
+
+def process_block(task: tuple) -> tuple:
+    """
+    Processes a block of a stream in a worker of the pool.
+
+    Requires:
+    task (tuple): A tuple (modes, block, options), where block (bytes) does not split any word.
+    Ensures:
+    Returning a tuple (partial, events), where partial is the partial result of the block for the given modes,
+    as given by scan_words and packed by pack_partial,
+    and events is the list of trace events of the block with --stats, None otherwise.
+    """
+    modes, block, options = task
+    if not options["stats"]:
+        if modes == "t":
+            return {"t": count_tokens(block, options)}, None
+        return pack_partial(scan_words(new_partial(modes, options), [block.split()], options), options), None
+
+    start = time.perf_counter()
+    if modes == "t":
+        partial = {"t": count_tokens(block, options)}
+    else:
+        # The words are counted along with the other modes, for the statistics
+        partial = scan_words(new_partial(modes if "t" in modes else "t" + modes, options), [block.split()], options)
+    words = partial["t"] if "t" in modes else partial.pop("t")
+    pack_partial(partial, options)
+    events = []
+    trace_event(events, "count", start, bytes=len(block), words=words)
+    return partial, events
+
+
+def count_stream(file: str, num_processes: int, modes: str, options: dict, events: list = None) -> tuple:
+    """
+    Processes a stream, such as the standard input or a named pipe, block by block.
+    With several processes, blocks are handed to a pool as they are read, but no more than
+    STREAM_BLOCKS_PER_PROCESS blocks per process wait or run at once: reading waits for the workers to catch up,
+    so that memory stays bounded whatever the length of the stream.
+    A compressed stream is decompressed as it is read (see read_stream).
+
+    Requires:
+    file (str): str indicating a file's directory, or "-" for the standard input.
+    num_processes (int): The number of processes to use for parallel processing.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    events (list): The trace events of the run, recorded with --stats (see trace_event), or None.
+    Ensures:
+    Merging the partial results of every block, and returning a tuple (result, stream_size, parts),
+    where stream_size is the number of bytes read and parts the number of blocks.
+    """
+    result = pack_partial(new_partial(modes, options), options)
+    stream_size = 0
+    parts = 0
+
+    def merge(returned) -> dict:
+        # Merges the partial result of a block, as returned by process_block
+        partial, block_events = returned
+        if block_events is not None:
+            trace_tasks(events, block_events, time.perf_counter(), pool_start, dispatched, workers)
+        start = time.perf_counter()
+        merged = merge_partials(result, partial, options)
+        trace_event(events, "merge", start, file=file)
+        return merged
+
+    def read():
+        # Reads the stream, recording the time spent reading every block
+        start = time.perf_counter()
+        for block in read_stream(file):
+            trace_event(events, "read", start, file=file, bytes=len(block))
+            yield block
+            start = time.perf_counter()
+
+    if num_processes == 1:
+        pool_start = dispatched = workers = None
+        for block in read():
+            stream_size += len(block)
+            parts += 1
+            result = merge(process_block((modes, block, options)))
+    else:
+        workers = set()
+        pool_start = time.perf_counter()
+        with multiprocessing.Pool(num_processes) as pool:
+            pending = deque()
+            for block in read():
+                stream_size += len(block)
+                parts += 1
+                if len(pending) == num_processes * STREAM_BLOCKS_PER_PROCESS:
+                    # Backpressure: wait for the oldest block before reading more
+                    start = time.perf_counter()
+                    returned = pending[0][1].get()
+                    trace_event(events, "backpressure", start, file=file)
+                    dispatched = pending.popleft()[0]
+                    result = merge(returned)
+                pending.append((time.perf_counter(), pool.apply_async(process_block, ((modes, block, options),))))
+            while pending:
+                dispatched, returned = pending.popleft()
+                result = merge(returned.get())
+
+    return result, stream_size, parts
+
 
+def divide_stream(file: str, num_processes: int, modes: str, options: dict, events: list = None) -> Result:
+    """
+    Processes a stream, such as the standard input or a named pipe, with count_stream.
+
+    Requires:
+    file (str): str indicating a file's directory, or "-" for the standard input.
+    num_processes (int): The number of processes to use for parallel processing.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    events (list): The trace events of the run, recorded with --stats (see trace_event), or None.
+    Ensures:
+    Returning the Result of the stream, with the number of bytes read as the size of the stream.
+    """
+    result, stream_size, parts = count_stream(file, num_processes, modes, options, events)
+    return make_result(file, result, stream_size, parts)
 
-def divide_one_file(file: str, num_processes: int, auxiliaryFunction: callable, words_count:  multiprocessing.Value) -> None:
+
+def divide_one_file(file: str, num_processes: int, modes: str, options: dict, events: list = None) -> Result:
     """
-    Divides a single text file by its size and processes it using multiple processes, 
-    accumulating the results of the lines and words of its parts processed.
+    Divides a single text file into byte ranges and processes them using a pool of processes,
+    merging the partial results of its parts in a map/reduce fashion.
 
     Requires:
     file (str): str indicating a text file's directory
     num_processes (int): The number of processes to use for parallel processing.
-    auxiliaryFunction (callable): One of the three functions that handle the given modes of pwordcount: "t_words", "u_words", or "o_words".
-    words_count (multiprocessing.Value): A shared variable to accumulate the total word count, used by t_words and u_words.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    events (list): The trace events of the run, recorded with --stats (see trace_event), or None.
     Ensures:
-    Dividing a text file into specified chunks and processing chunks in parallel, accumulating results, 
-    and printing the results for the given mode.
+    Dividing a text file into byte ranges aligned to whitespace, so that every word belongs to exactly one range,
+    processing the ranges in parallel (map), merging their partial results (reduce),
+    and returning the Result of the file, along with the time spent merging.
+    With a cache directory, a file whose result is cached is not processed again,
+    and with --incremental only the bytes appended since the last run are processed, without a pool if there are none.
+    A compressed file is divided into the units given by find_units instead, or if it has a single unit,
+    such as a gzip file of one member, decompressed by the current process while its blocks are processed
+    by the pool, as with streams.
+    Streams are processed by divide_stream.
     """
+    if is_stream(file):
+        return divide_stream(file, num_processes, modes, options, events)
 
-    # Get the size of the file
-    file_size = calc_size(file)
+    start = time.perf_counter()
+    compression = file_compression(file)
+    # Compressed files cannot be appended to, they are always processed whole
+    file_options = dict(options, incremental=False) if compression else options
+    entry, start_byte, end_byte, base = start_file(file, modes, file_options)
+    if entry is None and base is not None:
+        # Unchanged file, no need to process it again
+        trace_event(events, "plan", start, file=file, cached=True)
+        return make_result(file, base, calc_size(file), 0)
 
-    # Calculate the size of each chunk
-    chunk_size = file_size // num_processes
+    units = find_units(file, compression) if compression else calc_chunks(file, num_processes, start_byte, end_byte)
+    trace_event(events, "plan", start, file=file, parts=len(units))
 
-    processes = []
+    if compression and len(units) == 1:
+        # A single unit would keep one process busy while the others are idle
+        result, _, parts = count_stream(file, num_processes, modes, options, events)
+        start = time.perf_counter()
+        result = finish_file(file, modes, file_options, entry, end_byte, base, result)
+        trace_event(events, "finish", start, file=file)
+        return make_result(file, result, calc_size(file), parts)
 
-    for i in range(num_processes):
-        # Calculate the start and end lines for this chunk
-        start_line = i * chunk_size if i != 0 else 1
-        end_line = (i + 1) * chunk_size
+    if not units:
+        # Nothing was appended since the last run with --incremental, or the file is empty
+        start = time.perf_counter()
+        result = finish_file(file, modes, file_options, entry, end_byte, base, pack_partial(new_partial(modes, options), options))
+        trace_event(events, "finish", start, file=file)
+        return make_result(file, result, calc_size(file), 0)
 
-        # Create a new process for each chunk
-        if (auxiliaryFunction == t_words):
-            # If the given mode is t, subprocess will handle the creation of processes.
-            t_words(file, start_line, end_line, words_count)
-        else:
-            process = multiprocessing.Process(target=auxiliaryFunction, args=(
-                file, start_line, end_line, words_count))
-            process.start()
-            processes.append(process)
+    pool_start = time.perf_counter()
+    with multiprocessing.Pool(num_processes) as pool:
+        # Map: every worker returns the partial result of its chunk
+        dispatched = time.perf_counter()
+        partials = []
+        fragments = []
+        workers = set()
+        tasks = [(0, part, modes, file, compression, unit, options, False) for part, unit in enumerate(units)]
+        for _, _, partial, fragment, task_events in pool.imap(run_task, tasks):
+            if task_events is not None:
+                trace_tasks(events, task_events, time.perf_counter(), pool_start, dispatched, workers)
+            partials.append(partial)
+            fragments.append(fragment)
+        if None in partials:
+            # A unit of the compressed file could not be decompressed on its own, decompress the whole file
+            _, _, partial, fragment, _ = run_task((0, 0, modes, file, compression, None, options, False))
+            partials, fragments = [partial], [fragment]
 
-    for process in processes:
-        process.join()
+        # Reduce: partial results are merged into the result of the whole file
+        merge_start = time.perf_counter()
+        result = reduce_partials(partials, pack_partial(new_partial(modes, options), options), options, pool)
+        if compression:
+            result = finish_units(result, fragments, modes, options)
+        merge_time = time.perf_counter() - merge_start
+        trace_event(events, "merge", merge_start, file=file, parts=len(partials))
+
+    start = time.perf_counter()
+    result = finish_file(file, modes, file_options, entry, end_byte, base, result)
+
+    if options["cache"]:
+        evict_cache(options)
+    trace_event(events, "finish", start, file=file)
+
+    return make_result(file, result, calc_size(file), len(partials), merge_time)
+
+
+def match_globs(path: str, patterns: tuple) -> bool:
+    """
+    Tells whether a path matches any of the given glob patterns.
+
+    Requires:
+    path (str): The path of a file or directory, relative to the directory in which it was found.
+    patterns (tuple): Glob patterns, as given by --include or --exclude.
+    Ensures:
+    Returning True if a pattern matches the name of the file or directory, or its whole path.
+    """
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+
+def is_selected(path: str, options: dict) -> bool:
+    """
+    Tells whether a file found in a directory or listed by --files-from is counted.
+
+    Requires:
+    path (str): The path of the file, relative to the directory in which it was found.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning True if the file matches a pattern of --include, or no --include is given,
+    and does not match any pattern of --exclude.
+    """
+    return ((not options["include"] or match_globs(path, options["include"]))
+            and not match_globs(path, options["exclude"]))
+
+
+def scan_directory(directory: str, relative: str, options: dict) -> tuple:
+    """
+    Lists a directory for walk_directories.
+    The size of every file is taken from the same stat that tells it is a regular file.
+
+    Requires:
+    directory (str): str indicating the directory to list.
+    relative (str): The path of the directory relative to the directory given by -r, "" for the latter.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Returning a tuple (files, subdirectories), where files is a list of pairs (path, size) of the regular files
+    selected by is_selected, biggest first, and subdirectories a list of pairs (path, relative) of the subdirectories
+    that do not match --exclude; symbolic links to directories are not followed.
+    Subdirectories and entries that cannot be read are skipped.
+    """
+    files, subdirectories = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                path = relative + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not match_globs(path, options["exclude"]):
+                            subdirectories.append((entry.path, path + os.sep))
+                    elif is_selected(path, options):
+                        info = entry.stat()
+                        if stat.S_ISREG(info.st_mode):
+                            files.append((entry.path, info.st_size))
+                except OSError:
+                    # Broken link or entry removed during the walk
+                    continue
+    except OSError:
+        if not relative:
+            raise
+    files.sort()
+    subdirectories.sort()
+    return sorted(files, key=itemgetter(1), reverse=True), subdirectories
+
+
+def walk_directories(directories: list, options: dict, pool, events: list = None):
+    """
+    Walks directories and their subdirectories, listing many directories at once.
+
+    Requires:
+    directories (list): A list of directory paths, in str, as given by -r.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    pool (multiprocessing.pool.ThreadPool): The threads listing the directories with scan_directory.
+    events (list): The trace events of the run, recorded with --stats (see trace_event), or None.
+    Ensures:
+    Yielding the files of every directory as soon as it is listed, as given by scan_directory,
+    the directories being taken breadth first while the threads list the following ones.
+    """
+    pending = deque(pool.apply_async(scan_directory, (directory, "", options)) for directory in directories)
+    while pending:
+        start = time.perf_counter()
+        files, subdirectories = pending.popleft().get()
+        pending.extend(pool.apply_async(scan_directory, subdirectory + (options,)) for subdirectory in subdirectories)
+        trace_event(events, "walk", start, files=len(files))
+        if files:
+            yield files
+
+
+def read_file_list(file: str):
+    """
+    Reads the paths listed by --files-from.
+
+    Requires:
+    file (str): str indicating the directory of a file holding one path per line, or "-" for the standard input.
+    Ensures:
+    Yielding the listed paths in lists of at most LIST_BATCH paths, as they are read; empty lines are skipped.
+    """
+    stream = sys.stdin if file == "-" else open(file)
+    try:
+        paths = []
+        for line in stream:
+            path = line.rstrip("\r\n")
+            if path:
+                paths.append(path)
+            if len(paths) == LIST_BATCH:
+                yield paths
+                paths = []
+        if paths:
+            yield paths
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def stat_listed(path: str):
+    """
+    Stats a file listed by --files-from for find_files.
+
+    Requires:
+    path (str): str indicating the directory of a listed file.
+    Ensures:
+    Returning the os.stat_result of the file, or None after reporting it in the standard error
+    if it cannot be read, e.g. a stale entry of the list.
+    """
+    try:
+        return os.stat(path)
+    except OSError as error:
+        print(f"Skipped {path}: {error.strerror or error}", file=sys.stderr)
+        return None
+
+
+def find_files(files: list, directories: list, options: dict, events: list = None):
+    """
+    Finds and sizes every file to be counted by divide_between, with several threads,
+    handing the files over in batches as soon as they are found.
+
+    Requires:
+    files (list): A list of file paths, in str, that are not streams.
+    directories (list): A list of directory paths, in str, whose files are counted, as given by -r.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    events (list): The trace events of the run, recorded with --stats (see trace_event), or None.
+    Ensures:
+    Yielding lists of pairs (path, size), biggest first: the given files, then the files listed by --files-from
+    and selected by is_selected, then the files found in the directories by walk_directories.
+    Files listed by --files-from that are not regular files or cannot be read are skipped, see stat_listed.
+    """
+    with multiprocessing.pool.ThreadPool(WALK_THREADS) as pool:
+        if files:
+            start = time.perf_counter()
+            sizes = pool.map(calc_size, files)
+            trace_event(events, "size", start, files=len(files))
+            yield sorted(zip(files, sizes), key=itemgetter(1), reverse=True)
+        if options["files_from"]:
+            for paths in read_file_list(options["files_from"]):
+                start = time.perf_counter()
+                paths = [path for path in paths if is_selected(path, options)]
+                infos = pool.map(stat_listed, paths)
+                batch = [(path, info.st_size) for path, info in zip(paths, infos)
+                         if info is not None and stat.S_ISREG(info.st_mode)]
+                trace_event(events, "size", start, files=len(batch))
+                yield sorted(batch, key=itemgetter(1), reverse=True)
+        yield from walk_directories(directories, options, pool, events)
 
-    if (auxiliaryFunction == t_words):
-        print(
-            f'The file "{file}" has {words_count.value} words, and a total size of {file_size} bytes.')
-    elif (auxiliaryFunction == u_words):
-        print(
-            f'The file "{file}" has {words_count.value} unique words, and a total size of {file_size} bytes.')
-    else:
-        print("• End of list •")
-        print(f'Size of "{file}": {file_size} bytes.')
+
+def parse_address(address: str) -> object:
+    """
+    Interprets the address of a worker daemon, as given by --worker or --listen.
+
+    Requires:
+    address (str): "host:port", or the path of a Unix socket.
+    Ensures:
+    Returning a tuple (host, port) for a TCP address, or the path of the Unix socket,
+    as expected by multiprocessing.connection.
+    """
+    host, colon, port = address.rpartition(":")
+    if colon and host and port.isdigit() and "/" not in address:
+        return host, int(port)
+    return address
+
+
+class WorkerError(ConnectionError):
+    """
+    Raised by dispatch_tasks when the tasks of --worker could not be run, by lack of workers or of attempts.
+    """
+
+
+def dispatch_tasks(tasks, options: dict):
+    """
+    Runs tasks of run_task on the worker daemons of --worker, instead of the processes of the current machine.
+    Every worker tells its number of processes once connected, and is sent up to WORKER_TASKS_PER_PROCESS tasks
+    per process, the next one as soon as it returns a result, so that faster workers take more tasks.
+    A task that fails in a worker, or whose worker disconnects, is dispatched again, to a worker it did not fail in
+    if there is one, at most TASK_ATTEMPTS times in all; the run goes on with the workers left.
+
+    Requires:
+    tasks (iterable): The tasks of run_task, with absolute paths, planned as they are dispatched.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    Ensures:
+    Yielding the tuple returned by run_task for every task, in the order in which they are completed.
+    Raising WorkerError if there are tasks left and no worker to run them,
+    or if a task was dispatched TASK_ATTEMPTS times without a result.
+    """
+    tasks = iter(tasks)
+    authkey = os.environ[AUTHKEY_VARIABLE].encode()
+    # Address of every connected worker, the number of tasks it may still be sent, and its running tasks by id
+    workers = {}
+    for address in options["workers"]:
+        try:
+            connection = multiprocessing.connection.Client(parse_address(address), authkey=authkey)
+            _, _, num_processes = connection.recv()
+        except (OSError, EOFError, multiprocessing.AuthenticationError) as error:
+            print(f"Worker {address} is unreachable: {error}", file=sys.stderr)
+            continue
+        workers[connection] = {"address": address, "free": num_processes * WORKER_TASKS_PER_PROCESS, "running": {}}
+    # Tasks to dispatch again, each one a list [id, task, attempts, addresses of the workers it failed in]
+    retries = deque()
+    num_tasks = 0
+    planned = False
+
+    def next_task(address):
+        # Takes a task to retry that did not fail in the worker, or that failed in every worker left, or else a new task
+        nonlocal num_tasks, planned
+        addresses = {worker["address"] for worker in workers.values()}
+        for retry in retries:
+            if address not in retry[3] or retry[3] >= addresses:
+                retries.remove(retry)
+                return retry
+        task = None if planned else next(tasks, None)
+        if task is None:
+            planned = True
+            return None
+        num_tasks += 1
+        return [num_tasks, task, 0, set()]
+
+    def fail(retry, address, error):
+        # Dispatches a task again, unless it was dispatched TASK_ATTEMPTS times
+        retry[2] += 1
+        if retry[2] == TASK_ATTEMPTS:
+            raise WorkerError(f"a task of {retry[1][3]} failed {TASK_ATTEMPTS} times, last in worker {address}: {error}")
+        retry[3].add(address)
+        retries.append(retry)
+
+    def drop(connection, error):
+        # Dispatches the running tasks of a disconnected worker to the others
+        worker = workers.pop(connection)
+        connection.close()
+        print(f"Worker {worker['address']} disconnected: {error}", file=sys.stderr)
+        for retry in worker["running"].values():
+            fail(retry, worker["address"], error)
+
+    try:
+        while True:
+            for connection, worker in list(workers.items()):
+                while worker["free"] and connection in workers:
+                    retry = next_task(worker["address"])
+                    if retry is None:
+                        break
+                    worker["running"][retry[0]] = retry
+                    worker["free"] -= 1
+                    try:
+                        connection.send((retry[0], retry[1]))
+                    except OSError as error:
+                        drop(connection, error)
+            if not any(worker["running"] for worker in workers.values()):
+                if not workers and (retries or next_task(None) is not None):
+                    raise WorkerError("no worker left to run the tasks of --worker")
+                # Every task was run
+                return
+
+            for connection in multiprocessing.connection.wait(list(workers)):
+                worker = workers[connection]
+                try:
+                    status, task_id, returned = connection.recv()
+                except (OSError, EOFError) as error:
+                    drop(connection, str(error) or "connection closed")
+                    continue
+                retry = worker["running"].pop(task_id)
+                worker["free"] += 1
+                if status == "result":
+                    yield returned
+                else:
+                    fail(retry, worker["address"], returned)
+    finally:
+        for connection in workers:
+            try:
+                # Tells the worker that no more tasks will be sent
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
 
 
-def divide_between(files: list, num_processes: int, auxiliaryFunction: callable) -> None:
+def divide_between(files: list, num_processes: int, modes: str, options: dict, events: list = None, directories: list = ()):
     """
-    Generates individual processes for every file in a specified list of files, 
-    dispatching them for parallel execution when a sufficient number of processes are available,
-    or queuing them when if the number of processes are less than that of files.
-    Printing of the results is then handled by the given auxiliary function.
+    Processes every file in a specified list of files with a single pool of processes.
+    Files are dispatched biggest first, and every idle process takes the next pending task,
+    so that processes that finish early take over the work left by the others.
+    Files bigger than SPLIT_THRESHOLD are divided into byte ranges that are dispatched as separate tasks,
+    so that a single big file does not keep one process busy while the others are idle.
+    Compressed files are divided into the units given by find_units, each one dispatched as a task;
+    when it is the only file left to process and has a single unit, it is decompressed by the current process
+    while its blocks are processed by the pool, as in divide_one_file.
+    Files found in directories or listed by --files-from are dispatched as soon as they are found by find_files,
+    biggest first within every batch, so that the processes count them while the others are still being found;
+    files that are removed or made unreadable before they are planned are reported and skipped.
+    With --worker, the tasks are dispatched to worker daemons by dispatch_tasks instead of a pool,
+    with absolute paths, and the partial results are merged in the current process as they are returned.
 
     Requires:
     files (list): A list of file paths, in str, to be processed.
-    num_processes (int): The number of processes available to use.
-    auxiliaryFunction (callable): One of the three auxiliary functions that handle the given modes of pwordcount: "t", "u", or "o".
+    num_processes (int): The number of processes available to use, at most one per task is used when every file is known.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    events (list): The trace events of the run, recorded with --stats (see trace_event), or None.
+    directories (list): A list of directory paths, in str, whose files are also processed, as given by -r.
     Ensures:
-    Processing each of the given files, with one process for each file if processes are enough, or queuing them otherwise,
-    and sending them off for handling by the auxiliary functions which will then print the requested data.
+    Processing each of the given files, merging the results of the parts of divided files,
+    and yielding the Result of every file as soon as all of its parts are processed.
+    With a cache directory, the results of cached files are yielded right away and the files are not dispatched,
+    and with --incremental only the bytes appended to the uncompressed files since the last run are dispatched.
+    Streams (see is_stream) are processed first, one after the other, by divide_stream, in the current machine.
+    Raising WorkerError if the tasks of --worker could not be run, see dispatch_tasks.
     """
-    if num_processes == 1:
-        print(f"Using 1 process")
-    elif num_processes > len(files):
-        # More processes than files, equalize processes to number of files
-        print(f"Using {len(files)} process")
-        num_processes = len(files)
+    # Without directories or a list of files, every file is known before the first one is dispatched
+    known = not directories and not options["files_from"]
+
+    streams = [file for file in files if is_stream(file)]
+    for stream in streams:
+        yield divide_stream(stream, num_processes, modes, options, events)
+    files = [file for file in files if file not in streams]
+
+    # Paths and sizes of the files, in the order in which they are found, and the values given by start_file
+    # for every file, with the compression format and options of the file
+    paths, sizes, starts = [], [], []
+    parts_left = []
+    # Results of cached files, yielded as soon as they are found
+    cached = deque()
+
+    # Worker daemons may run in other directories, they are given absolute paths
+    remote = bool(options["workers"])
+    task_options = options
+    if remote and options["stopwords"]:
+        task_options = dict(options, stopwords=os.path.abspath(options["stopwords"]))
+
+    def plan_tasks():
+        # Yields the tasks of every file as soon as it is found, biggest first within every batch of find_files
+        for batch in find_files(files, directories, options, events):
+            for file, size in batch:
+                start = time.perf_counter()
+                try:
+                    compression = file_compression(file)
+                    # Compressed files cannot be appended to, they are always processed whole
+                    file_options = dict(options, incremental=False) if compression else options
+                    entry, start_byte, end_byte, base = start_file(file, modes, file_options)
+                except OSError as error:
+                    # Removed or made unreadable since it was found
+                    print(f"Skipped {file}: {error.strerror or error}", file=sys.stderr)
+                    continue
+                index = len(paths)
+                paths.append(file)
+                sizes.append(size)
+                starts.append((entry, end_byte, base, compression, file_options))
+                if entry is None and base is not None:
+                    # Unchanged file, no need to process it again
+                    parts_left.append(0)
+                    trace_event(events, "plan", start, file=file, cached=True)
+                    cached.append(make_result(file, base, size, 0))
+                    continue
+                if compression:
+                    units = find_units(file, compression)
+                elif (num_processes > 1 or remote) and end_byte - start_byte > SPLIT_THRESHOLD:
+                    # Big file, divide it between the processes
+                    units = calc_chunks(file, -(-(end_byte - start_byte) // SPLIT_THRESHOLD), start_byte, end_byte)
+                else:
+                    units = [(start_byte, end_byte)]
+                # Only whole files may be reduced to their list in the workers, and not with --incremental which needs every word;
+                # without --top or --min-count, the list holds every word and there is nothing to leave out;
+                # the unique words of mode -m u are those of the list of mode -m o, which must hold every word
+                select = ("o" in modes and "u" not in modes and units == [(0, size)] and not compression
+                          and not options["incremental"] and not options["approx"]
+                          and (options["top"] is not None or options["min_count"] > 1))
+                # The parts of the file are known before any of them is processed
+                parts_left.append(len(units))
+                trace_event(events, "plan", start, file=file, parts=len(units))
+                path = os.path.abspath(file) if remote else file
+                for part, unit in enumerate(units):
+                    yield index, part, modes, path, compression, unit, task_options, select
+
+    results = {}
+    num_parts = {}
+    # Fragments of the units of compressed files, None for the units that could not be decompressed on their own
+    fragments = {}
+
+    def collect(partials, pool_start=None, dispatched=None):
+        # Merges the partial results of every file, in the order in which they are returned
+        workers = set()
+        for index, part, partial, fragment, task_events in partials:
+            while cached:
+                yield cached.popleft()
+            if task_events is not None:
+                trace_tasks(events, task_events, time.perf_counter(), pool_start, dispatched, workers)
+            start = time.perf_counter()
+            num_parts.setdefault(index, parts_left[index])
+            fragments.setdefault(index, [None] * parts_left[index])
+            if partial is not None:
+                results[index] = merge_partials(results[index], partial, options) if index in results else partial
+                fragments[index][part] = fragment
+            trace_event(events, "merge", start, file=paths[index])
+            parts_left[index] -= 1
+            if parts_left[index] == 0:
+                start = time.perf_counter()
+                entry, end_byte, base, compression, file_options = starts[index]
+                # Free the result as soon as it is handed over
+                result = results.pop(index, None)
+                file_fragments = fragments.pop(index)
+                if compression and None in file_fragments:
+                    # A unit of the compressed file could not be decompressed on its own, decompress the whole file
+                    _, _, result, fragment, _ = run_task((index, 0, modes, paths[index], compression, None, options, False))
+                    file_fragments = [fragment]
+                if compression:
+                    result = finish_units(result, file_fragments, modes, options)
+                result = finish_file(paths[index], modes, file_options, entry, end_byte, base, result)
+                trace_event(events, "finish", start, file=paths[index])
+                yield make_result(paths[index], result, sizes[index], num_parts.pop(index))
+        while cached:
+            yield cached.popleft()
+
+    tasks = plan_tasks()
+    if known:
+        # Every file is planned first, so that cached results are yielded before any file is processed
+        tasks = list(tasks)
+        while cached:
+            yield cached.popleft()
+    if remote:
+        # The clocks of other machines are not those of the current one, the waiting times of the tasks are not measured
+        yield from collect(dispatch_tasks(tasks, options))
+    elif known and num_processes > 1 and len(tasks) == 1 and tasks[0][4]:
+        # A lone compressed file of a single unit, decompressed by the current process while its blocks
+        # are processed by the pool, as in divide_one_file
+        index = tasks[0][0]
+        entry, end_byte, base, _, file_options = starts[index]
+        result, _, parts = count_stream(paths[index], num_processes, modes, options, events)
+        start = time.perf_counter()
+        result = finish_file(paths[index], modes, file_options, entry, end_byte, base, result)
+        trace_event(events, "finish", start, file=paths[index])
+        yield make_result(paths[index], result, sizes[index], parts)
+    elif num_processes == 1 or (known and len(tasks) <= 1):
+        # No need for other processes
+        yield from collect(map(run_task, tasks))
     else:
-        print(f"Using {str(num_processes)} processes")
+        if known:
+            # More processes than tasks, once big files are divided, equalize processes to number of tasks
+            num_processes = min(num_processes, len(tasks))
+        pool_start = time.perf_counter()
+        with multiprocessing.Pool(num_processes) as pool:
+            # chunksize=1 so that every idle process takes one task at a time,
+            # the tasks of files still being found are planned by the pool as it dispatches them
+            dispatched = time.perf_counter()
+            yield from collect(pool.imap_unordered(run_task, tasks, chunksize=1), pool_start, dispatched)
+
+    if options["cache"]:
+        start = time.perf_counter()
+        evict_cache(options)
+        trace_event(events, "evict", start)
+
+
+def parse_modes(modes) -> str:
+    """
+    Checks and normalizes a combination of modes.
+
+    Requires:
+    modes (iterable): Modes of pwordcount, e.g. "tu" or {"t", "o"}.
+    Ensures:
+    Returning the given modes as a str, each mode once, in the order of MODES.
+    Raising ValueError if no mode is given or a mode is unknown.
+    """
+    if not modes or any(mode not in MODES for mode in modes):
+        raise ValueError(f"invalid modes: {modes!r}, expected a combination of {', '.join(MODES)}")
+    return "".join(mode for mode in MODES if mode in modes)
 
-    file_queue = multiprocessing.Queue()
 
-    if len(files) > num_processes:
-        # Less processes than files, tasks will be queued
-        print("Number of files greater than number of processes, tasks will be queued")
-        
-        # Sort files by size, so that the bigger files get processed first
-        sorted_files_by_size = sorted(files, key=lambda file: calc_size(file), reverse=True)
+def count_files(files: list, num_processes: int, modes: str, options: dict, events: list = None, directories: list = ()):
+    """
+    Processes text files with the given modes, dividing a single file between the processes.
 
-        for file in sorted_files_by_size:
-            file_queue.put(file)
+    Requires:
+    files (list): A list of file paths, in str, to be processed.
+    num_processes (int): The number of processes to use for parallel processing.
+    modes (str): The modes to compute, as given by parse_modes.
+    options (dict): The --name=value options given to pwordcount, see DEFAULT_OPTIONS.
+    events (list): The list to which the trace events of the run are appended with --stats (see trace_event), or None.
+    directories (list): A list of directory paths, in str, whose files are also processed, as given by -r.
+    Ensures:
+    Yielding the Result of every file, in the order in which they are completed:
+    with a single file and several processes, the file is divided by divide_one_file,
+    otherwise the files, with those found in the directories and listed by --files-from,
+    are shared between the processes, or the worker daemons of --worker, by divide_between.
+    """
+    if len(files) == 1 and num_processes > 1 and not directories and not options["files_from"] and not options["workers"]:
+        yield divide_one_file(files[0], num_processes, modes, options, events)
     else:
-        for file in files:
-            file_queue.put(file)
+        yield from divide_between(files, num_processes, modes, options, events, directories)
 
-    print()
 
-    processes = []
-    for _ in range(num_processes):
-        if (auxiliaryFunction == "t_words"):
-            # If the given mode is t, subprocess will handle the creation of processes.
-            t_words(file_queue)
+def count(files, modes="t", processes: int = 1, events: list = None, directories: list = (), **options):
+    """
+    Counts the words of text files, computing any combination of modes in a single read of each file.
+    It is the library interface of pwordcount, on which its command line is built:
+    >>> result = count("your_file.txt", modes={"t", "u", "o"}, processes=4)
+    >>> result.total, result.unique_count(), result.word_counts().most_common(10)
+
+    Requires:
+    files (list): A list of file paths, in str, or a single file path; "-" is the standard input.
+    modes (iterable): The modes to compute, any combination of "t", "u" and "o", e.g. "tu" or {"t", "o"}.
+    processes (int): The number of processes to use for parallel processing.
+    events (list): A list to which the trace events of the run are appended (see trace_event), None to not record them.
+    directories (list): A list of directory paths, in str, whose files are also counted (see find_files).
+    options: The options of DEFAULT_OPTIONS to change, e.g. mmap=True, cache="DIR", approx=True
+    or workers=("host:port",) to dispatch the files to worker daemons (see worker).
+    With top or min_count, the occurrences of whole files may only hold the words selected by select_occurrences.
+    A pattern implies tokenizer="regex".
+    Ensures:
+    Returning the Result of a single file path, or a list of the Results of the files, in the given order,
+    followed by the Results of the files found in the directories or listed by files_from, sorted by path.
+    Raising ValueError if a mode or an option is invalid,
+    and WorkerError if the tasks of workers could not be run (see dispatch_tasks).
+    """
+    unknown = [name for name in options if name not in DEFAULT_OPTIONS]
+    if unknown:
+        raise ValueError(f"unknown options: {', '.join(unknown)}")
+    if options.get("pattern") is not None:
+        # As with --pattern, a pattern implies the regex tokenizer, by which it is only used
+        if options.setdefault("tokenizer", "regex") != "regex":
+            raise ValueError(f"a pattern is only used by the regex tokenizer, not {options['tokenizer']!r}")
+    options = {**DEFAULT_OPTIONS, **options, "stats": events is not None}
+    check_options(options)
+    if not is_count(processes):
+        raise ValueError(f"invalid number of processes: {processes!r}")
+    modes = parse_modes(modes)
+    missing = [directory for directory in directories if not os.path.isdir(directory)]
+    if missing:
+        raise ValueError(f"not directories: {', '.join(missing)}")
+
+    single = isinstance(files, str) and not directories and not options["files_from"]
+    files = [files] if isinstance(files, str) else list(files)
+    # Results are completed in any order, they are returned in the order of the files
+    completed = {}
+    for result in count_files(files, processes, modes, options, events, directories):
+        completed.setdefault(result.file, deque()).append(result)
+    results = [completed[file].popleft() for file in files]
+    results += sorted((result for found in completed.values() for result in found), key=lambda result: result.file)
+    return results[0] if single else results
+
+
+def generate_corpus(directory: str, num_files: int, options: dict) -> tuple:
+    """
+    Generates a synthetic corpus for the bench subcommand.
+    Words are random lowercase strings drawn from a fixed vocabulary with a Zipf distribution,
+    the word of rank r being about r times less frequent than the most frequent one, as in natural text.
+
+    Requires:
+    directory (str): str indicating the directory where the files of the corpus are written.
+    num_files (int): The number of files the corpus is divided into.
+    options (dict): The options of the bench subcommand, see BENCH_OPTIONS.
+    Ensures:
+    Writing num_files files of options["size"] MiB in total, of lines of options["line_length"] words,
+    the same for the same seed, and returning a tuple (files, num_bytes, num_words).
+    """
+    rng = random.Random(options["seed"])
+    vocabulary = set()
+    while len(vocabulary) < options["vocabulary"]:
+        vocabulary.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 12))))
+    vocabulary = sorted(vocabulary)
+    rng.shuffle(vocabulary)
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    files = []
+    num_bytes = num_words = 0
+    file_size = options["size"] * 1024 * 1024 // num_files
+    for i in range(num_files):
+        file = os.path.join(directory, f"corpus-{num_files}-{i}.txt")
+        written = 0
+        with open(file, 'w') as f:
+            while written < file_size:
+                words = rng.choices(vocabulary, cum_weights=cum_weights, k=options["line_length"] * 1024)
+                text = "\n".join(" ".join(words[j:j + options["line_length"]]) for j in range(0, len(words), options["line_length"])) + "\n"
+                if written + len(text) > file_size:
+                    # Stop at the last line that fits
+                    text = text[:text.rfind("\n", 0, file_size - written) + 1]
+                    if not text:
+                        break
+                f.write(text)
+                written += len(text)
+                num_words += text.count(" ") + text.count("\n")
+        files.append(file)
+        num_bytes += written
+    return files, num_bytes, num_words
+
+
+def peak_rss() -> int:
+    """
+    Measures the peak memory of the current process and of its workers.
+    On Linux, the peak of the process is its own VmHWM: ru_maxrss also holds the peak of the process
+    it was started from, before exec, e.g. the bench process holding the corpora.
+
+    Ensures:
+    Returning the largest resident set of the current process and of its terminated child processes, in KiB.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max(own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def time_case(case: str) -> None:
+    """
+    Runs a case of the bench subcommand, in the new process started by run_case.
+
+    Requires:
+    case (str): A JSON object with the files, modes, processes and options given to count.
+    Ensures:
+    Printing a JSON object with the time taken by count, in seconds, and the peak memory of the case
+    and of its workers, as given by peak_rss.
+    """
+    case = json.loads(case)
+    start = time.perf_counter()
+    count(case["files"], case["modes"], case["processes"], **case["options"])
+    print(json.dumps({"seconds": time.perf_counter() - start, "peak_rss": peak_rss()}))
+
+
+def run_case(files: list, modes: str, num_processes: int, options: dict) -> tuple:
+    """
+    Runs a case of the bench subcommand in a new process, so that its memory is measured on its own.
+
+    Requires:
+    files (list): A list of file paths, in str, to be processed.
+    modes (str): The modes to compute, as given by parse_modes.
+    num_processes (int): The number of processes to use for parallel processing.
+    options (dict): The options of DEFAULT_OPTIONS to change.
+    Ensures:
+    Returning a tuple (seconds, peak_rss), where seconds is the time taken by count, without starting Python,
+    and peak_rss is the largest resident set of the process and its workers, in KiB, as measured by the case itself.
+    Printing an error and exiting if the case fails.
+    """
+    case = json.dumps({"files": files, "modes": modes, "processes": num_processes, "options": options})
+    command = [sys.executable, "-c", "import sys; sys.path.insert(0, sys.argv[1]); import pwordcount; pwordcount.time_case(sys.argv[2])",
+               os.path.dirname(os.path.abspath(__file__)), case]
+    process = subprocess.run(command, stdout=subprocess.PIPE)
+    if process.returncode != 0:
+        print(f"Error: bench case failed: -m {modes} -p {num_processes} {options}")
+        sys.exit(1)
+    result = json.loads(process.stdout)
+    return result["seconds"], result["peak_rss"]
+
+
+def parse_bench_options(args: list) -> dict:
+    """
+    Interprets the --name=value options of the bench subcommand.
+
+    Requires:
+    args (list): A list of command-line arguments given after "bench".
+    Ensures:
+    Returning a copy of BENCH_OPTIONS updated with the given options, lists given as comma-separated values.
+    Printing an error and exiting if an option is unknown or has an invalid value.
+    """
+    options = dict(BENCH_OPTIONS)
+
+    for arg in args:
+        name, _, value = arg[2:].partition("=")
+        name = name.replace("-", "_")
+        values = value.split(",")
+        if not arg.startswith("--") or name not in BENCH_OPTIONS:
+            valid = False
+        elif name in ("size", "vocabulary", "line_length", "repeat"):
+            valid = value.isdigit() and int(value) > 0
+            options[name] = int(value) if valid else None
+        elif name == "seed":
+            valid = value.isdigit()
+            options[name] = int(value) if valid else None
+        elif name in ("files", "processes"):
+            valid = all(item.isdigit() and int(item) > 0 for item in values)
+            options[name] = [int(item) for item in values] if valid else None
+        elif name == "modes":
+            valid = all(item and all(mode in MODES for mode in item) for item in values)
+            options[name] = [parse_modes(item) for item in values] if valid else None
+        elif name == "engines":
+            valid = all(item in ENGINES for item in values)
+            options[name] = values
+        elif name == "scans":
+            valid = all(item in BENCH_SCANS for item in values)
+            options[name] = values
+        elif name == "corpus":
+            valid = all(os.path.isfile(item) for item in values)
+            options[name] = values
+        elif name == "tolerance":
+            valid = bool(re.fullmatch(r"0?\.\d*[1-9]\d*", value))
+            options[name] = float(value) if valid else None
         else:
-            process = multiprocessing.Process(
-                target=auxiliaryFunction, args=(file_queue,))
-            process.start()
-            processes.append(process)
+            # --output and --baseline
+            valid = bool(value)
+            options[name] = value
+        if not valid:
+            print(f"Error: invalid option: {arg}")
+            sys.exit()
 
-    for process in processes:
-        process.join()
+    return options
 
 
-def t(file_queue: list) -> None:
+def bench_key(result: dict) -> tuple:
     """
-    Executes mode -m t.
-    It uses subprocess to run an external bash shell command in a new process and capture its output.
+    Identifies a case of the bench subcommand regardless of its number of processes.
 
     Requires:
-    file_queue (list): A list of file paths (str) in queue to be processed.
+    result (dict): A result of the report of bench.
     Ensures:
-    Performing the code for calculating the number of words in a text file in the bash shell.
+    Returning a tuple (modes, engine, scan, files).
     """
-    while not file_queue.empty():
-        file = file_queue.get()
-        words = subprocess.run(f"cat '{file}' | wc -w", shell=True, text=True, stdout=subprocess.PIPE).stdout.strip()
-        print(
-            f'The file "{file}" has {words} words, and a total size of {calc_size(file)} bytes.')
+    return result["modes"], result["engine"], result["scan"], result["files"]
 
 
-def t_words(file: str, start_line: int, end_line: int, words_count: multiprocessing.Value) -> None:
+def bench(args: list) -> None:
     """
-    Auxiliary function of divide_one_file, which is called when pwordcount receives a single file.
-    It uses subprocess to run an external bash shell command in a new process and capture its output.
+    Runs the bench subcommand: times every mode across engines, scans, numbers of files and processes.
+    Every case runs repeat times in a new process, and its fastest run is kept.
 
     Requires:
-    file (str): str indicating a text file's directory
-    start_line (int): The starting line number for word counting.
-    end_line (int): The ending line number for word counting.
-    words_count (multiprocessing.Value): A shared variable to accumulate the total word count, used by t_words and u_words.
+    args (list): A list of command-line arguments given after "bench", see BENCH_OPTIONS.
     Ensures:
-    This function calculates the number of words in a specified range of lines (between start_line and end_line) within a text file and updates the total word count.
+    Writing a JSON report to options["output"], or to the standard output, with the machine, the corpus,
+    and for every case its time, throughput in MB/s and words/s, peak resident set in KiB,
+    and speedup over the same case with a single process.
+    Corpora are generated in a temporary directory, unless existing files are given by --corpus.
+    With --baseline, printing every case whose throughput dropped by more than options["tolerance"]
+    from the report given, and exiting with status 1 if there are any.
     """
-    words = subprocess.run(f"sed -n {start_line},{end_line}p {file} | wc -w", shell=True, text=True, stdout=subprocess.PIPE).stdout.strip()
-    words_count.value += int(words)
+    options = parse_bench_options(args)
+    directory = None if options["corpus"] else tempfile.mkdtemp(prefix="pwordcount-bench-")
 
+    try:
+        corpora = {}
+        if options["corpus"]:
+            files = [os.path.abspath(file) for file in options["corpus"]]
+            num_words = sum(result.total for result in count(files))
+            corpora[len(files)] = (files, sum(calc_size(file) for file in files), num_words)
+        else:
+            for num_files in options["files"]:
+                corpora[num_files] = generate_corpus(directory, num_files, options)
+
+        results = []
+        for modes in options["modes"]:
+            for engine in options["engines"]:
+                # The engine only counts mode -m t on its own, and never through a memory map
+                if engine != "native" and modes != "t":
+                    continue
+                for scan in options["scans"]:
+                    if engine != "native" and scan != "read":
+                        continue
+                    for num_files, (files, num_bytes, num_words) in corpora.items():
+                        for num_processes in options["processes"]:
+                            print(f"Running -m {modes} --engine={engine} ({scan}) with {num_files} files and {num_processes} processes",
+                                  file=sys.stderr)
+                            runs = [run_case(files, modes, num_processes, {"engine": engine, "mmap": scan == "mmap"})
+                                    for _ in range(options["repeat"])]
+                            seconds = min(seconds for seconds, _ in runs)
+                            results.append({
+                                "modes": modes, "engine": engine, "scan": scan,
+                                "files": num_files, "processes": num_processes,
+                                "seconds": round(seconds, 6),
+                                "mb_per_s": round(num_bytes / 1e6 / seconds, 3),
+                                "words_per_s": round(num_words / seconds),
+                                "peak_rss_kib": max(peak_rss for _, peak_rss in runs),
+                            })
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    # Speedup curves: every case against the same case with a single process
+    single = {bench_key(result): result["seconds"] for result in results if result["processes"] == 1}
+    for result in results:
+        base = single.get(bench_key(result))
+        result["speedup"] = round(base / result["seconds"], 3) if base else None
+
+    report = {
+        "machine": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+        "corpus": {
+            "sizes": [{"files": num_files, "bytes": num_bytes, "words": num_words}
+                      for num_files, (_, num_bytes, num_words) in corpora.items()],
+            "vocabulary": None if options["corpus"] else options["vocabulary"],
+            "line_length": None if options["corpus"] else options["line_length"],
+            "seed": None if options["corpus"] else options["seed"],
+        },
+        "results": results,
+    }
+    if options["output"]:
+        with open(options["output"], 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if options["baseline"]:
+        with open(options["baseline"]) as f:
+            baseline = {bench_key(result) + (result["processes"],): result for result in json.load(f)["results"]}
+        regressions = 0
+        for result in results:
+            previous = baseline.get(bench_key(result) + (result["processes"],))
+            if previous and result["mb_per_s"] < (1 - options["tolerance"]) * previous["mb_per_s"]:
+                regressions += 1
+                print(f'Regression: -m {result["modes"]} --engine={result["engine"]} ({result["scan"]}) with {result["files"]} files '
+                      f'and {result["processes"]} processes: {result["mb_per_s"]} MB/s, {previous["mb_per_s"]} MB/s in the baseline',
+                      file=sys.stderr)
+        if regressions:
+            sys.exit(1)
 
-def u(file_queue: list) -> None:
+
+def parse_worker_options(args: list) -> dict:
     """
-    Executes mode -m u
+    Interprets the --name=value options of the worker subcommand.
 
     Requires:
-    file_queue (list): A list of file paths (str) in queue to be processed.
+    args (list): A list of command-line arguments given after "worker".
     Ensures:
-    Performing the code for calculating the number of unique/different words in a text file in the bash shell.
+    Returning a copy of WORKER_OPTIONS updated with the given options.
+    Printing an error and exiting if an option is unknown or has an invalid value,
+    if no address is given or if the secret shared with the coordinators is not set.
     """
-    while not file_queue.empty():
-        file = file_queue.get()
-        unique_words = set()
-        with open(file, 'r') as f:
-            for line in f:
-                words = line.split()
-                unique_words.update(words)
+    options = dict(WORKER_OPTIONS)
 
-        print(
-            f'The file "{file}" has {len(unique_words)} unique words, and a total size of {calc_size(file)} bytes.')
+    for arg in args:
+        name, _, value = arg[2:].partition("=")
+        if not arg.startswith("--") or name not in WORKER_OPTIONS:
+            valid = False
+        elif name == "processes":
+            valid = value.isdigit() and int(value) > 0
+            options[name] = int(value) if valid else None
+        else:
+            # --listen
+            valid = bool(value)
+            options[name] = value
+        if not valid:
+            print(f"Error: invalid option: {arg}")
+            sys.exit()
 
+    if options["listen"] is None:
+        print("Error: the worker needs an address to listen on, given by --listen=ADDRESS")
+        sys.exit()
+    if AUTHKEY_VARIABLE not in os.environ:
+        print(f"Error: the worker needs the secret shared with the coordinators, given by the {AUTHKEY_VARIABLE} environment variable")
+        sys.exit()
+    return options
 
-def u_words(file: str, start_line: int, end_line: int, words_count: multiprocessing.Value) -> int:
+
+def serve_coordinator(connection, pool: multiprocessing.Pool, num_processes: int) -> None:
     """
-    Auxiliary function of divide_one_file, which is called when pwordcount receives a single file.
+    Runs the tasks sent by a coordinator to a worker daemon, in a thread of its own.
 
     Requires:
-    file (str): str indicating a text file's directory
-    start_line (int): The starting line number for word counting.
-    end_line (int): The ending line number for word counting.
-    words_count (multiprocessing.Value): A shared variable to accumulate the total word count, used by t_words and u_words.
+    connection (multiprocessing.connection.Connection): The authenticated connection of the coordinator.
+    pool (multiprocessing.Pool): The pool of the worker daemon, shared by every coordinator.
+    num_processes (int): The number of processes of the pool.
     Ensures:
-    This function calculates the number of unique/different 
-    words in a specified range of lines (between start_line and end_line) within a text file and updates the total word count.
+    Telling the coordinator the number of processes, then running every task (id, task) it sends with run_task
+    and sending back ("result", id, returned) as soon as it is returned, or ("error", id, message) if it raised,
+    until the coordinator sends None or disconnects. The results of a disconnected coordinator are dropped.
     """
-    unique_words = set()
-    lines_processed = 0
+    # Results are sent by the thread of the pool handling them, one at a time
+    lock = threading.Lock()
 
-    with open(file, 'r') as f:
-        for line_num, line in enumerate(f, start=1):
-            if start_line <= line_num < end_line:
-                # Process a line located in the specified range
-                words = line.split()
-                unique_words.update(words)
-                lines_processed += 1
+    def reply(message):
+        with lock:
+            try:
+                connection.send(message)
+            except OSError:
+                pass
 
-    words_count.value += len(unique_words)
+    reply(("hello", None, num_processes))
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            task_id, task = message
+            pool.apply_async(run_task, (task,), callback=lambda returned, task_id=task_id: reply(("result", task_id, returned)),
+                             error_callback=lambda error, task_id=task_id: reply(("error", task_id, f"{type(error).__name__}: {error}")))
+    except (OSError, EOFError):
+        pass
+    finally:
+        with lock:
+            connection.close()
 
 
-def o(file_queue: list) -> None:
+def worker(args: list) -> None:
     """
-    Executes mode -m o
+    Runs the worker subcommand: a daemon counting the files of coordinators, other runs of pwordcount given --worker,
+    e.g. on every machine of a cluster sharing the same files under the same paths.
 
     Requires:
-    file_queue (list): A list of file paths (str) in queue to be processed.
+    args (list): The --name=value options of the worker subcommand, see WORKER_OPTIONS.
     Ensures:
-    Performing the code for calculating the number of occurrences of each of the
-    unique/different words in a text file in the bash shell.
+    Listening on options["listen"] until interrupted, and serving every coordinator that connects
+    with the secret of AUTHKEY_VARIABLE by serve_coordinator, with a single pool of options["processes"] processes.
+    Connections without the secret are refused.
     """
-    while not file_queue.empty():
-        file = file_queue.get()
-        word_counts = Counter()
-        with open(file, 'r') as f:
-            for line in f:
-                words = line.split()
-                word_counts.update(words)
-
-        print(f'Number of occurrences of each word in "{file}":')
-        for word, occurences in word_counts.items():
-            if (occurences == 1):
-                print(f"{word}: {occurences} time")
-            else:
-                print(f"{word}: {occurences} times")
-        print("• End of list •")
-        print(f'Size of "{file}": {calc_size(file)} bytes.')
+    options = parse_worker_options(args)
+    authkey = os.environ[AUTHKEY_VARIABLE].encode()
+    # The pool is started first, so that its processes do not inherit the listening socket
+    with multiprocessing.Pool(options["processes"]) as pool:
+        try:
+            listener = multiprocessing.connection.Listener(parse_address(options["listen"]), authkey=authkey)
+        except OSError as error:
+            print(f"Error: cannot listen on {options['listen']}: {error}")
+            sys.exit()
+        with listener:
+            print(f"Listening on {options['listen']} with {options['processes']} processes", flush=True)
+            try:
+                while True:
+                    try:
+                        connection = listener.accept()
+                    except (OSError, EOFError, multiprocessing.AuthenticationError) as error:
+                        print(f"Refused a connection: {error}", file=sys.stderr, flush=True)
+                        continue
+                    threading.Thread(target=serve_coordinator, args=(connection, pool, options["processes"]), daemon=True).start()
+            except KeyboardInterrupt:
+                pass
 
 
-def o_words(file: str, start_line: int, end_line: int, words_count: multiprocessing.Value) -> None:
+def parse_options(args: list) -> tuple:
     """
-    Auxiliary function of divide_one_file, which is called when pwordcount receives a single file.
-    Processes a text file, counts the occurrences of each word in the file, and prints the results.
+    Separates the --name=value options from the rest of the command-line arguments.
 
     Requires:
-    file (str): str indicating a text file's directory
-    start_line (int): The starting line number for word counting.
-    end_line (int): The ending line number for word counting.
-    words_count (multiprocessing.Value): A shared variable to accumulate the total word count, used by t_words and u_words.
-    Ensures: This function calculates the number of occurrences of 
-    each of the unique/different words in a specified range of lines (between start_line and end_line) 
-    within a text file and updates the total word count.
+    args (list): A list of command-line arguments.
+    Ensures:
+    Returning a tuple (options, remaining_args), where options is a copy of DEFAULT_OPTIONS
+    updated with the given --name=value options and remaining_args holds every other argument, in order.
+    Printing an error and exiting if an option is unknown or has an invalid value.
     """
-    word_counts = Counter()
-    lines_processed = 0
+    options = dict(DEFAULT_OPTIONS)
+    remaining_args = []
 
-    with open(file, 'r') as f:
-        for line in f:
-            words = line.split()[start_line:end_line]
-            word_counts.update(words)
-            lines_processed += 1
+    for arg in args:
+        if not arg.startswith("--"):
+            remaining_args.append(arg)
+            continue
+        name, _, value = arg[2:].partition("=")
+        if name == "engine" and value:
+            options["engine"] = value
+        elif name == "mmap" and not value:
+            options["mmap"] = True
+        elif name == "cache" and value:
+            options["cache"] = value
+        elif name == "cache-size" and value.isdigit():
+            options["cache_size"] = int(value)
+        elif name == "incremental" and not value:
+            options["incremental"] = True
+        elif name == "top" and value.isdigit():
+            options["top"] = int(value)
+        elif name == "min-count" and value.isdigit():
+            options["min_count"] = int(value)
+        elif name == "approx" and not value:
+            options["approx"] = True
+        elif name == "error" and re.fullmatch(r"\d*\.?\d+", value):
+            options["error"] = float(value)
+        elif name == "stats" and not value:
+            options["stats"] = True
+        elif name == "trace" and value:
+            # A trace is made of the phases recorded by --stats
+            options["trace"] = value
+            options["stats"] = True
+        elif name in ("include", "exclude") and value:
+            # Both may be given several times
+            options[name] += (value,)
+        elif name == "files-from" and value:
+            options["files_from"] = value
+        elif name == "tokenizer" and value:
+            options["tokenizer"] = value
+        elif name == "pattern" and value:
+            # A pattern is only used by the regex tokenizer
+            options["pattern"] = value
+            options["tokenizer"] = "regex"
+        elif name == "case" and value:
+            options["case"] = value
+        elif name == "strip-punctuation" and not value:
+            options["strip_punctuation"] = True
+        elif name == "stopwords" and value:
+            options["stopwords"] = value
+        elif name == "worker" and value:
+            # May be given several times, once per worker daemon
+            options["workers"] += (value,)
+        else:
+            print(f"Error: invalid option: {arg}")
+            sys.exit()
 
-    if start_line == 1:
-        print(f'Number of occurrences of each word in "{file}":')
-    for word, occurences in word_counts.items():
-        if (occurences == 1):
-            print(f"{word}: {occurences} time")
+    try:
+        check_options(options)
+    except ValueError as error:
+        print(f"Error: {error}")
+        sys.exit()
+
+    return options, remaining_args
+
+
+def parse_arguments(args: list, options: dict) -> tuple:
+    """
+    Interprets the command-line arguments left by parse_options.
+
+    Requires:
+    args (list): A list of command-line arguments: "-m" and "-p", each followed by its value
+    and given at most once, and "-r" followed by a directory, given any number of times, in any order,
+    then the file paths.
+    options (dict): The --name=value options given to pwordcount, as given by parse_options.
+    Ensures:
+    Returning a tuple (modes, num_processes, files, directories), with mode "t" and a single process by default.
+    Printing an error and exiting if the arguments are invalid.
+    """
+    modes, num_processes = "t", 1
+    directories = []
+    given = []
+
+    while len(args) > 1 and args[0] in ("-m", "-p", "-r") and args[0] not in given:
+        flag, value = args[0], args[1]
+        if flag != "-r":
+            given.append(flag)
+        args = args[2:]
+        if flag == "-m" and value and all(mode in MODES for mode in value):
+            modes = parse_modes(value)
+        elif flag == "-p" and value.isdigit() and int(value) > 0:
+            num_processes = int(value)
+        elif flag == "-r" and os.path.isdir(value):
+            directories.append(value)
+        elif flag == "-r":
+            print(f"Error: directory does not exist: {value}")
+            sys.exit()
         else:
-            print(f"{word}: {occurences} times")
+            print("Error: invalid command")
+            sys.exit()
+
+    if not args and not directories and not options["files_from"]:
+        print("Error: no files were given")
+        sys.exit()
+    if args and (args[0] in ("-m", "-p", "-r") or (len(args[0]) == 2 and args[0].startswith("-"))):
+        print("Error: invalid command")
+        sys.exit()
 
+    return modes, num_processes, args, directories
 
-def main(args: list, words_count: multiprocessing.Value) -> None:
+
+def main(args: list) -> None:
     """
     Handles execution of pwordcount, its command-line arguments,
     and attribution of processes.
 
     Requires:
     args (list): A list of command-line arguments.
-    words_count (multiprocessing.Value): A shared variable to accumulate word counts, which are made by the modes -m t and -m u.
     Ensures:
     Interpreting command-line arguments and counting the words in the .txt file
     passed as argument in the command line, either in a single process or
-    several, based on the provided options. By default, if no arguments other than
-    the name of the .txt file are given, only a single process is used.
+    several, based on the provided options, through count_files.
+    By default, if no arguments other than the name of the .txt file are given,
+    only a single process and mode -m t are used.
     Options:
     -m t: Perform pwordcount to count the total number of words.
     -m u: Perform pwordcount to count the number of unique/different words.
     -m o: Perform pwordcount to count the number of occurences of each of the unique/different words.
+    -m tuo: Perform several modes at once, any combination of t, u and o, reading every file once.
     -p n: Execute pwordcount using n processes.
+    -r DIR: Also count the files found in DIR and its subdirectories, may be given several times.
+    --engine=shell|native: Count the words of mode -m t with wc -w, or in-process (default);
+    streams and compressed files are always counted in-process.
+    --mmap: Scan the files through a memory map, counting words as bytes.
+    --cache=DIR: Keep the result of every file in DIR, and reuse it while the file is unchanged.
+    --cache-size=n: Evict the least recently used results once DIR holds more than n MiB (256 by default).
+    --incremental: Keep in DIR how far every file was counted, and only count the bytes appended since then.
+    --top=k: List only the k most frequent words in mode -m o.
+    --min-count=n: List only the words found at least n times in mode -m o.
+    --approx: Estimate modes -m u and -m o in fixed memory, with a HyperLogLog and a Count-Min Sketch.
+    --error=e: Relative error targeted by --approx, 0.01 by default.
+    --stats: Record the duration of every phase of the run, and print a summary of them after the results.
+    --trace=FILE: Also write the phases recorded by --stats to FILE, as a Chrome trace.
+    --include=GLOB: Only count the files of -r and --files-from matching GLOB, may be given several times.
+    --exclude=GLOB: Leave out the files and directories of -r and --files-from matching GLOB, may be given several times.
+    --files-from=FILE: Also count the files listed in FILE, one per line, "-" for the standard input.
+    --tokenizer=whitespace|unicode|regex: Split words by whitespace (default), as Unicode words, or with --pattern.
+    --pattern=REGEX: Words of the regex tokenizer, matched within every whitespace-separated token; empty matches are left out.
+    --case=lower|fold: Lowercase or case fold the words.
+    --strip-punctuation: Remove the punctuation at the start and end of the words.
+    --stopwords=FILE: Leave the words of FILE out of every mode.
+    --worker=ADDRESS: Dispatch the files to the worker daemon listening on ADDRESS, may be given several times.
+    A file given as "-" is read from the standard input; it and named pipes are read as streams.
+    Files and streams compressed with gzip, bzip2 or xz, detected by their magic bytes, are counted decompressed.
     Example Usage:
     To perform pwordcount in a single .txt file using a single process:
     >>> main(["your_file.txt"])
     To perform pwordcount in two txt. files
     to count the number of unique/different words using 4 processes:
     >>> main(["-m", "u", "-p", "4", "your_file.txt", "your_other_file.txt"])
+    To count the total and unique words and their occurrences in a single read:
+    >>> main(["-m", "tuo", "your_file.txt"])
+    To count the occurrences of the words of every .txt file of a directory tree using 4 processes:
+    >>> main(["-m", "o", "-p", "4", "-r", "your_directory", "--include=*.txt"])
+    To benchmark every mode with 1, 2 and 4 processes on a synthetic corpus of 64 MiB (see BENCH_OPTIONS):
+    >>> main(["bench", "--size=64", "--processes=1,2,4", "--output=report.json"])
+    To count the files of a directory tree with two worker daemons, started with the same PWORDCOUNT_AUTHKEY:
+    >>> main(["worker", "--listen=node1:7000", "--processes=8"])
+    >>> main(["-m", "o", "-r", "your_directory", "--worker=node1:7000", "--worker=node2:7000"])
     """
 
+    if args and args[0] == "bench":
+        # The report of the bench subcommand is JSON, printed without the lines below
+        bench(args[1:])
+        return
+    if args and args[0] == "worker":
+        worker(args[1:])
+        return
+
     print('Programa: pwordcount.py')
     print('Argumentos: ', args)
 
-    # --- Argument meanings ----
+    options, args = parse_options(args)
+    modes, num_processes, files, directories = parse_arguments(args, options)
 
-    # Could be equal to "-m", "-p", or else the first given file path
-    if (args[0] == "-m" or args[0] == "-p"):
-        FIRST_ARGUMENT = args[0]
-        FIRST_ARGUMENT_AND_ON = None
+    if options["workers"]:
+        # The files are counted by the processes of the worker daemons
+        print(f"Using {len(options['workers'])} workers" if len(options["workers"]) > 1 else "Using 1 worker")
+        print("Files are dispatched to the workers")
+    elif directories or options["files_from"]:
+        # The number of files is not known, they are counted as they are found
+        if num_processes == 1:
+            print(f"Using 1 process")
+        else:
+            print(f"Using {str(num_processes)} processes")
+        print("Files are counted as they are found")
+    elif len(files) > 1 or num_processes == 1:
+        # If we have more than one file, do not divide files individually
+        if num_processes == 1:
+            print(f"Using 1 process")
+        elif num_processes > len(files):
+            # More processes than files, big files are divided into tasks and at most one process per task is used
+            print(f"Using up to {num_processes} processes, at most one per task")
+        else:
+            print(f"Using {str(num_processes)} processes")
+        if len(files) > num_processes:
+            # Less processes than files, tasks will be queued
+            print("Number of files greater than number of processes, tasks will be queued")
     else:
-        # If args[0] is not equal to -m or -p args[0:] will be a list of file paths
-        FIRST_ARGUMENT_AND_ON = args[0:]
-        FIRST_ARGUMENT = args[0]
-    if (len(args) >= 0):
-        # If FIRST_ARGUMENT == "-m", this will correspond to one of the
-        # three modes that can chosen t, u, or o;
-        # Else if FIRST_ARGUMENT == "-p", this will correspond to a positive int n of allowed processes;
-        # Else if FIRST_ARGUMENT is a file path this will be a second file path
-        try:
-            SECOND_ARGUMENT = args[1]
-        except IndexError:
-            SECOND_ARGUMENT = None
-    if (len(args) >= 1):
-        # If FIRST_ARGUMENT == "-m" and SECOND_ARGUMENT == "t" or "u" or "o", this might
-        # be equal to "-p", otherwise it will be the first given file path;
-        # Else if FIRST_ARGUMENT == "-p" and SECOND_ARGUMENT == n, where n is a positive int,
-        # this might be equal to "-m", otherwise it will be the first given file path;
-        # Else if FIRST_ARGUMENT and SECOND_ARGUMENT are file paths this will be a third file path
-        try:
-            if (args[2] == "-p" or args[2] == "-m"):
-                THIRD_ARGUMENT = args[2]
-                THIRD_ARGUMENT_AND_ON = None
-            else:
-                # If args[2] is not equal to -p or -m args[2:] will be a list of file paths
-                THIRD_ARGUMENT_AND_ON = args[2:]
-                THIRD_ARGUMENT = args[2]
-        except IndexError:
-            THIRD_ARGUMENT = None
-            THIRD_ARGUMENT_AND_ON = None
-    if (len(args) >= 2):
-        # If FIRST_ARGUMENT == "-m", SECOND_ARGUMENT == "t" or "u" or "o"
-        # and THIRD_ARGUMENT == "-p", this will correspond to a positive int n of allowed processes;
-        # Else if FIRST_ARGUMENT == "-m", SECOND_ARGUMENT == "t" or "u" or "o", and THIRD_ARGUMENT is a file path,
-        # this will be a second file path;
-        # Else if FIRST_ARGUMENT == "-p", SECOND_ARGUMENT == n, where n is a positive int,
-        # and THIRD_ARGUMENT == "-m", this will correspond to one of the
-        # three modes that can chosen t, u, or o;
-        # Else if FIRST_ARGUMENT == "-p", SECOND_ARGUMENT == n, where n is a positive int, and THIRD_ARGUMENT is a file path,
-        # this will be a second file path;
-        # Else if FIRST_ARGUMENT, SECOND_ARGUMENT, and THIRD_ARGUMENT are file paths,
-        # this will be a fourth file path;
-        try:
-            FOURTH_ARGUMENT = args[3]
-        except IndexError:
-            FOURTH_ARGUMENT = None
-    if (len(args) >= 3):
-        # Will always be a file path
-        # If FIRST_ARGUMENT == "-m", SECOND_ARGUMENT == "t" or "u" or "o", THIRD_ARGUMENT == "-p",
-        # and FOURTH_ARGUMENT == n, where n is a positive int, this will correspond to the first given file path;
-        # Else if FIRST_ARGUMENT == "-p", SECOND_ARGUMENT == n, where n is a positive int,
-        # THIRD_ARGUMENT == "-m", FOURTH_ARGUMENT == "t" or "u" or "o", this will correspond to the first given file path;
-        # Else if FIRST_ARGUMENT == "-m", SECOND_ARGUMENT == "t" or "u" or "o", and THIRD_ARGUMENT and
-        # FOURTH_ARGUMENT are a file paths, this will be a third file path;
-        # Else if FIRST_ARGUMENT == "-p", SECOND_ARGUMENT == n, where n is a positive int, and THIRD_ARGUMENT and
-        # FOURTH_ARGUMENT are a file paths, this will be a third file path;
-        # Else if FIRST_ARGUMENT, SECOND_ARGUMENT, THIRD_ARGUMENT, and FOURTH_ARGUMENT are file paths,
-        # this will be a fifth file path;
-        try:
-            # args[4:] will be a list of file paths
-            FIFTH_ARGUMENT_AND_ON = args[4:]
-        except IndexError:
-            FIFTH_ARGUMENT_AND_ON = None
-
-    if FIRST_ARGUMENT:
-        if len(FIRST_ARGUMENT) == 1 or (len(FIRST_ARGUMENT) == 2 and FIRST_ARGUMENT != "-m" and FIRST_ARGUMENT != "-p"):
-            print("Error: invalid command")
-            sys.exit()
-    if THIRD_ARGUMENT_AND_ON:
-        if FIRST_ARGUMENT == FOURTH_ARGUMENT:
-            print("Error: invalid command")
-            sys.exit()
+        # Else we have one file, and only one file, divide files individually
+        print(f"Using {str(num_processes)} processes")
+        print("File contents were divided between the given processes")
+    print()
 
-    if FIRST_ARGUMENT == "-m":
-        # Option -m t
-        if SECOND_ARGUMENT == "t":
-            if THIRD_ARGUMENT == "-p":
-                files = FIFTH_ARGUMENT_AND_ON
-                num_processes = int(FOURTH_ARGUMENT)
-                if len(files) > 1 or num_processes == 1:
-                    # If we have more than one file, do not divide files individually
-                    divide_between(files, num_processes, t)
-                else:
-                    # Else we have one file, and only one file, divide files individually
-                    print(f"Using {str(num_processes)} processes")
-                    if (num_processes != 1):
-                        print(
-                            "File contents were divided between the given processes")
-                    print()
-                    divide_one_file(
-                        files[0], num_processes, t_words, words_count)
+    events = [] if options["stats"] else None
+    run_start = time.perf_counter()
+    try:
+        for result in count_files(files, num_processes, modes, options, events, directories):
+            start = time.perf_counter()
+            print_result(result, options)
+            if result.merge_time is not None:
+                print(f"Merged the results of {result.parts} parts in {result.merge_time:.6f} seconds")
+            trace_event(events, "print", start, file=result.file)
+    except WorkerError as error:
+        # The tasks of --worker could not be run
+        print(f"Error: {error}")
+        sys.exit(1)
 
-            else:
-                # Use a single process
-                files = THIRD_ARGUMENT_AND_ON
-                divide_between(files, 1, t)
-        # Option -m u
-        if SECOND_ARGUMENT == "u":
-            if THIRD_ARGUMENT == "-p":
-                files = FIFTH_ARGUMENT_AND_ON
-                num_processes = int(FOURTH_ARGUMENT)
-                if len(files) > 1 or num_processes == 1:
-                    # If we have more than one file, do not divide files individually
-                    divide_between(files, num_processes, u)
-                else:
-                    # Else we have one file, and only one file, divide files individually
-                    print(f"Using {str(num_processes)} processes")
-                    if (num_processes != 1):
-                        print(
-                            "File contents were divided between the given processes")
-                    print()
-                    divide_one_file(
-                        files[0], num_processes, u_words, words_count)
-            else:
-                # Use a single process
-                files = THIRD_ARGUMENT_AND_ON
-                divide_between(files, 1, u)
-        # Option -m o
-        if SECOND_ARGUMENT == "o":
-            if THIRD_ARGUMENT == "-p":
-                files = FIFTH_ARGUMENT_AND_ON
-                num_processes = int(FOURTH_ARGUMENT)
-                if len(files) > 1 or num_processes == 1:
-                    # If we have more than one file, do not divide files individually
-                    divide_between(files, num_processes, o)
-                else:
-                    # Else we have one file, and only one file, divide files individually
-                    print(f"Using {str(num_processes)} processes")
-                    if (num_processes != 1):
-                        print(
-                            "File contents were divided between the given processes")
-                    print()
-                    divide_one_file(
-                        files[0], num_processes, o_words, words_count)
-            else:
-                # Use a single process
-                files = THIRD_ARGUMENT_AND_ON
-                divide_between(files, 1, o)
-    # Option -p
-    elif FIRST_ARGUMENT == "-p":
-        num_processes = int(SECOND_ARGUMENT)
-        if THIRD_ARGUMENT == "-m":
-            files = FIFTH_ARGUMENT_AND_ON
-            # Option -p n -m t
-            if FOURTH_ARGUMENT == "t":
-                if len(files) > 1 or num_processes == 1:
-                    # If we have more than one file, do not divide files individually
-                    divide_between(files, num_processes, t)
-                else:
-                    # Else we have one file, and only one file, divide files individually
-                    print(f"Using {str(num_processes)} processes")
-                    if (num_processes != 1):
-                        print(
-                            "File contents were divided between the given processes")
-                    print()
-                    divide_one_file(
-                        files[0], num_processes, t_words, words_count)
-            # Option -p n -m u
-            if FOURTH_ARGUMENT == "u":
-                if len(files) > 1 or num_processes == 1:
-                    # If we have more than one file, do not divide files individually
-                    divide_between(files, num_processes, u)
-                else:
-                    # Else we have one file, and only one file, divide files individually
-                    print(f"Using {str(num_processes)} processes")
-                    if (num_processes != 1):
-                        print(
-                            "File contents were divided between the given processes")
-                    print()
-                    divide_one_file(
-                        files[0], num_processes, u_words, words_count)
-            # Option -p n -m o
-            if FOURTH_ARGUMENT == "o":
-                # If we have more than one file, do not divide files individually
-                if len(files) > 1 or num_processes == 1:
-                    divide_between(files, num_processes, o)
-                else:
-                    # Else we have one file, and only one file, divide files individually
-                    print(f"Using {str(num_processes)} processes")
-                    if (num_processes != 1):
-                        print(
-                            "File contents were divided between the given processes")
-                    print()
-                    divide_one_file(
-                        files[0], num_processes, o_words, words_count)
-        else:
-            files = THIRD_ARGUMENT_AND_ON
-            # If we have more than one file, do not divide files individually
-            if len(files) > 1 or num_processes == 1:
-                divide_between(files, num_processes, t)
-            else:
-                # Else we have one file, and only one file, divide files individually
-                print(f"Using {str(num_processes)} processes")
-                if (num_processes != 1):
-                    print("File contents were divided between the given processes")
-                print()
-                divide_one_file(
-                    files[0], num_processes, t_words, words_count)
-    # If no options are given
-    else:
-        # Use a single process and mode -m t
-        files = FIRST_ARGUMENT_AND_ON
-        divide_between(files, 1, t)
+    if options["stats"]:
+        print_stats(events, time.perf_counter() - run_start)
+    if options["trace"]:
+        write_trace(events, options["trace"])
 
 
 if __name__ == "__main__":
-    # Shared words count
-    words_count = multiprocessing.Value('i', 0)
-    # Call main function
-    main(sys.argv[1:], words_count)
+    # Call main function of the pwordcount module, as imported by the programs calling count,
+    # so that the objects pickled by worker daemons are unpickled as the same classes whoever runs them
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import pwordcount
+    pwordcount.main(sys.argv[1:])
@@ -0,0 +1,469 @@
+import bz2
+import gzip
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from multiprocessing.connection import Listener
+from multiprocessing.pool import ThreadPool
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pwordcount
+
+
+def write_text(directory: str, num_words: int) -> str:
+    """
+    Writes a text file of random words, some of them with multi-byte characters, on lines of varying length.
+    """
+    rng = random.Random(1)
+    vocabulary = [f"w{i}" for i in range(2000)] + ["épsilon", "délta", "straße", "日本語", "don't"]
+    lines = []
+    while num_words > 0:
+        length = min(num_words, rng.randint(1, 20))
+        lines.append(" ".join(rng.choice(vocabulary) for _ in range(length)))
+        num_words -= length
+    path = os.path.join(directory, "text.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+class CacheTest(unittest.TestCase):
+    """
+    Loads the results of the cache for the options that give the same counts, and only for the same contents.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = os.path.join(self.directory, "cache")
+        self.text = os.path.join(self.directory, "text.txt")
+        self.edit("ab cd ab\n", 1)
+
+    def edit(self, text, mtime):
+        with open(self.text, 'w') as f:
+            f.write(text)
+        os.utime(self.text, (mtime, mtime))
+
+    def test_neutral_options(self):
+        pwordcount.count(self.text, "o", cache=self.cache)
+        result = pwordcount.count(self.text, "o", cache=self.cache, mmap=True, engine="shell")
+        self.assertEqual(result.parts, 0)
+        self.assertEqual(result.word_counts(), {"ab": 2, "cd": 1})
+
+    def test_selected_occurrences(self):
+        result = pwordcount.count([self.text], "o", cache=self.cache, top=1)[0]
+        self.assertEqual(dict(result.word_counts()), {"ab": 2})
+        result = pwordcount.count(self.text, "o", cache=self.cache)
+        self.assertEqual(result.word_counts(), {"ab": 2, "cd": 1})
+
+    def test_edited_file(self):
+        pwordcount.count(self.text, "tuo", cache=self.cache)
+        # Edited in place, with the same size
+        self.edit("ab cd cd\n", 2)
+        result = pwordcount.count(self.text, "tuo", cache=self.cache)
+        self.assertEqual(result.parts, 1)
+        self.assertEqual(result.word_counts(), {"ab": 1, "cd": 2})
+
+
+class CompressedInputTest(unittest.TestCase):
+    """
+    Counts compressed files divided into units, each decompressed by a task of its own,
+    and compares their results with those of the uncompressed file.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.text = write_text(cls.directory, 300000)
+        with open(cls.text, 'rb') as f:
+            cls.data = f.read()
+        cls.expected = pwordcount.count(cls.text, "tuo")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def assert_same_counts(self, path: str):
+        # Every unit of the file is a task of its own
+        with mock.patch.object(pwordcount, "COMPRESSED_TASK_SIZE", 1):
+            result = pwordcount.count(path, "tuo", processes=2)
+        self.assertGreater(result.parts, 1)
+        self.assertEqual(result.total, self.expected.total)
+        self.assertEqual(result.unique_words(), self.expected.unique_words())
+        self.assertEqual(result.word_counts(), self.expected.word_counts())
+        # The same file read as a stream, decompressed as it is read
+        with open(path, 'rb') as f, mock.patch.object(sys, "stdin", mock.Mock(buffer=f)):
+            streamed = pwordcount.count("-", "tuo")
+        self.assertEqual(streamed.word_counts(), self.expected.word_counts())
+
+    def test_gzip_members(self):
+        # Members split in the middle of words and of multi-byte characters
+        rng = random.Random(2)
+        cuts = sorted(rng.sample(range(1, len(self.data)), 7))
+        members = [self.data[start:end] for start, end in zip([0] + cuts, cuts + [len(self.data)])]
+        self.assert_same_counts(self.write("members.gz", b"".join(gzip.compress(member) for member in members)))
+
+    def test_single_member(self):
+        # A single unit, decompressed by the current process while its blocks are counted by the pool
+        path = self.write("single.gz", gzip.compress(self.data))
+        self.assertEqual(len(pwordcount.find_units(path, "gzip")), 1)
+        result = pwordcount.count(path, "tuo", processes=2)
+        self.assertGreater(result.parts, 1)
+        self.assertEqual(result.word_counts(), self.expected.word_counts())
+
+    def test_bzip2_blocks(self):
+        # Blocks of 100 kB at level 1
+        self.assert_same_counts(self.write("blocks.bz2", bz2.compress(self.data, 1)))
+
+    @unittest.skipUnless(shutil.which("xz"), "needs the xz command")
+    def test_xz_blocks(self):
+        # Blocks of 64 KiB, compressed by several threads
+        data = subprocess.run(["xz", "-T2", "--block-size=65536", "-c", self.text], stdout=subprocess.PIPE, check=True).stdout
+        self.assert_same_counts(self.write("blocks.xz", data))
+
+
+class DivideBetweenTest(unittest.TestCase):
+    """
+    Shares the tasks of several files between the processes of a pool.
+    """
+
+    def test_processes_of_divided_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        big = write_text(directory, 300000)
+        small = os.path.join(directory, "small.txt")
+        with open(small, 'w') as f:
+            f.write("one two\n")
+        # The big file is divided into more tasks than there are files
+        with mock.patch.object(pwordcount, "SPLIT_THRESHOLD", 256 * 1024), \
+                mock.patch("multiprocessing.Pool", wraps=multiprocessing.Pool) as pool:
+            results = pwordcount.count([big, small], "t", processes=4)
+        self.assertGreater(results[0].parts, 4)
+        pool.assert_called_once_with(4)
+        self.assertEqual(results[0].total, 300000)
+
+
+class FoundFilesTest(unittest.TestCase):
+    """
+    Counts files listed by --files-from that are stale or removed before they are planned.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.paths = []
+        for name, text in (("a.txt", "one two three\n"), ("b.txt", "four five\n")):
+            path = os.path.join(self.directory, name)
+            with open(path, 'w') as f:
+                f.write(text)
+            self.paths.append(path)
+        self.list = os.path.join(self.directory, "list")
+
+    def write_list(self, paths: list):
+        with open(self.list, 'w') as f:
+            f.write("".join(path + "\n" for path in paths))
+
+    def test_stale_entry(self):
+        self.write_list([self.paths[0], os.path.join(self.directory, "missing.txt"), self.paths[1]])
+        with mock.patch("sys.stderr") as stderr:
+            results = pwordcount.count([], "t", files_from=self.list)
+        self.assertEqual([result.file for result in results], self.paths)
+        self.assertEqual([result.total for result in results], [3, 2])
+        self.assertIn("missing.txt", "".join(str(call) for call in stderr.write.call_args_list))
+
+    def test_removed_before_planned(self):
+        self.write_list(self.paths)
+        file_compression = pwordcount.file_compression
+
+        def remove_first(file):
+            # The first file is removed after it is found, before it is planned
+            if file == self.paths[0]:
+                os.remove(file)
+            return file_compression(file)
+
+        with mock.patch.object(pwordcount, "file_compression", remove_first), mock.patch("sys.stderr"):
+            results = pwordcount.count([], "t", files_from=self.list)
+        self.assertEqual([(result.file, result.total) for result in results], [(self.paths[1], 2)])
+
+
+class IncrementalTest(unittest.TestCase):
+    """
+    Counts a file again with --incremental after it was appended to, truncated, rotated or left unchanged.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = os.path.join(self.directory, "cache")
+        self.text = os.path.join(self.directory, "text.txt")
+
+    def write(self, text, mode='w'):
+        with open(self.text, mode) as f:
+            f.write(text)
+
+    def count(self):
+        return pwordcount.count(self.text, "tuo", 2, cache=self.cache, incremental=True)
+
+    def assert_counts(self, result, text):
+        words = text.split()
+        self.assertEqual(result.total, len(words))
+        self.assertEqual(result.unique_count(), len(set(words)))
+        self.assertEqual(result.word_counts(), Counter(words))
+
+    def test_append_split_word(self):
+        self.write("ab cd ef\ngh ij")
+        self.assert_counts(self.count(), "ab cd ef\ngh ij")
+        # The last word of the previous run is completed by the append
+        self.write("kl mn\nab ", 'a')
+        self.assert_counts(self.count(), "ab cd ef\ngh ijkl mn\nab ")
+
+    def test_truncation(self):
+        self.write("ab cd ef\ngh ij kl\n")
+        self.count()
+        self.write("ab cd\n")
+        self.assert_counts(self.count(), "ab cd\n")
+
+    def test_rotation(self):
+        self.write("ab cd ef\ngh ij kl\n")
+        self.count()
+        # A new file at the same path, longer than the counted bytes of the old one
+        os.rename(self.text, self.text + ".1")
+        self.write("xy " * 20)
+        self.assert_counts(self.count(), "xy " * 20)
+
+    def test_no_new_bytes(self):
+        self.write("ab cd ab\nef gh")
+        self.count()
+        with mock.patch("multiprocessing.Pool") as pool:
+            result = self.count()
+        pool.assert_not_called()
+        self.assert_counts(result, "ab cd ab\nef gh")
+        self.assertEqual((result.parts, result.merge_time), (0, None))
+
+
+class OptionsTest(unittest.TestCase):
+    """
+    Rejects the invalid options given to count or on the command line.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.text = os.path.join(directory, "text.txt")
+        with open(self.text, 'w') as f:
+            f.write("ab cd ab\n")
+
+    def test_invalid_options(self):
+        for processes, options in ((1, {"engine": "bogus"}), (1, {"approx": True, "error": 0}), ("2", {}),
+                                   (True, {}), (1, {"top": -1}), (1, {"min_count": "2"}), (1, {"cache_size": 0})):
+            with self.subTest(processes=processes, **options), self.assertRaises(ValueError):
+                pwordcount.count(self.text, "t", processes, **options)
+
+    def test_invalid_command_line(self):
+        for option in ("--engine=bogus", "--error=0", "--error=1.5", "--top=0", "--min-count=0", "--cache-size=0"):
+            with self.subTest(option=option), mock.patch("sys.stdout"), self.assertRaises(SystemExit):
+                pwordcount.parse_options([option, self.text])
+
+
+class ProcessesTest(unittest.TestCase):
+    """
+    Counts the same words with a single process as with several, whose ranges start inside words and characters.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        rng = random.Random(1)
+        vocabulary = [f"w{i}" for i in range(200)] + [f"日本{i}語" for i in range(200)] + ["straße", "ÉPSILON"]
+        self.text = os.path.join(directory, "text.txt")
+        with open(self.text, 'w', encoding='utf-8') as f:
+            f.write(" ".join(rng.choice(vocabulary) for _ in range(20000)) + "\n")
+        self.copy = os.path.join(directory, "copy.txt")
+        shutil.copyfile(self.text, self.copy)
+        with open(self.text, 'rb') as f:
+            self.data = f.read()
+
+    def assert_split(self, num_chunks):
+        # The offsets divided by calc_chunks before they are aligned to whitespace
+        offsets = [i * len(self.data) // num_chunks for i in range(1, num_chunks)]
+        self.assertTrue(any(0x80 <= self.data[offset] < 0xC0 for offset in offsets))
+        self.assertTrue(any(self.data[offset - 1:offset + 1].isalnum() for offset in offsets))
+
+    def assert_same_counts(self, files, processes, **options):
+        for modes in ("t", "u", "o", "tu", "to", "uo", "tuo"):
+            for mmap in (False, True):
+                with self.subTest(modes=modes, mmap=mmap):
+                    expected = pwordcount.count(files, modes, 1, mmap=mmap, **options)
+                    results = pwordcount.count(files, modes, processes, mmap=mmap, **options)
+                    for result, single in zip(results, expected):
+                        self.assertGreater(result.parts, 1)
+                        self.assertEqual(result.total, single.total)
+                        if "u" in modes:
+                            self.assertEqual(result.unique_count(), single.unique_count())
+                        if "o" in modes:
+                            self.assertEqual(result.word_counts(), single.word_counts())
+
+    def test_one_file(self):
+        self.assert_split(5)
+        self.assert_same_counts([self.text], 5)
+        self.assert_same_counts([self.text], 5, case="fold", tokenizer="unicode")
+
+    def test_divided_files(self):
+        threshold = len(self.data) // 5 + 1
+        self.assert_split(5)
+        with mock.patch.object(pwordcount, "SPLIT_THRESHOLD", threshold):
+            self.assert_same_counts([self.text, self.copy], 3)
+
+
+class TokenizerTest(unittest.TestCase):
+    """
+    Counts the words of the options of the tokenizer.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.text = os.path.join(self.directory, "text.txt")
+        with open(self.text, 'w') as f:
+            f.write("ab cd ab\nef ab\n")
+
+    def test_empty_matches(self):
+        for processes in (1, 2):
+            result = pwordcount.count(self.text, "tuo", processes, tokenizer="regex", pattern=r"\w*")
+            self.assertEqual(result.total, 5)
+            self.assertEqual(result.word_counts(), {"ab": 3, "cd": 1, "ef": 1})
+
+    def test_pattern_implies_regex(self):
+        result = pwordcount.count(self.text, "o", pattern="[a-c]")
+        self.assertEqual(result.word_counts(), {"a": 3, "b": 3, "c": 1})
+        with self.assertRaises(ValueError):
+            pwordcount.count(self.text, "o", tokenizer="unicode", pattern="[a-c]")
+
+    def test_edited_stopwords(self):
+        cache = os.path.join(self.directory, "cache")
+        stopwords = os.path.join(self.directory, "stop.txt")
+        for mtime, excluded, expected in ((1, "ab", {"cd": 1, "ef": 1}), (2, "cd", {"ab": 3, "ef": 1})):
+            # Edited in place, with the same size
+            with open(stopwords, 'w') as f:
+                f.write(excluded + "\n")
+            os.utime(stopwords, (mtime, mtime))
+            for _ in range(2):
+                result = pwordcount.count(self.text, "o", cache=cache, stopwords=stopwords)
+                self.assertEqual(result.word_counts(), expected)
+
+
+class VocabularyTest(unittest.TestCase):
+    """
+    Merges the packed vocabularies of modes -m u and -m o, empty words included.
+    """
+
+    def test_merge_occurrences(self):
+        parts = [Counter({b"": 2, b"ab": 1}), Counter({b"ab": 2, b"": 3, b"x": 1}), Counter({b"x": 4, "é".encode(): 1})]
+        vocabulary = pwordcount.pack_vocabulary(parts[0])
+        for part in parts[1:]:
+            vocabulary = pwordcount.merge_vocabularies(vocabulary, pwordcount.pack_vocabulary(part))
+        self.assertEqual(pwordcount.unpack_vocabulary(vocabulary), {"": 5, "ab": 3, "x": 5, "é": 1})
+
+    def test_merge_into_smaller(self):
+        # The words are merged into the biggest vocabulary, whatever the order
+        small = pwordcount.pack_vocabulary(Counter({b"": 1}))
+        big = pwordcount.pack_vocabulary(Counter({b"abc": 1, b"def": 2, b"": 4}))
+        merged = pwordcount.merge_vocabularies(small, big)
+        self.assertIs(merged, big)
+        self.assertEqual(pwordcount.unpack_vocabulary(merged), {"": 5, "abc": 1, "def": 2})
+
+    def test_merge_unique(self):
+        first = pwordcount.pack_vocabulary({b"", b"ab"})
+        second = pwordcount.pack_vocabulary({b"ab", b"", b"cd"})
+        merged = pwordcount.merge_vocabularies(first, second)
+        self.assertEqual(pwordcount.unpack_vocabulary(merged), {"", "ab", "cd"})
+        self.assertEqual(pwordcount.split_vocabulary(merged).count(b""), 1)
+
+    def test_select_packed(self):
+        # Words of several lengths and scripts, with ties, then invalid UTF-8 words decoding to the same str
+        valid = Counter({"b".encode(): 3, "é".encode(): 3, "a".encode(): 3, "日本".encode(): 1, "ab".encode(): 2})
+        invalid = valid + Counter({b"\xff": 2, b"\xfe": 2})
+        for word_counts in (valid, invalid):
+            vocabulary = pwordcount.pack_vocabulary(word_counts)
+            for top, min_count in ((None, 1), (2, 1), (None, 2), (10, 3)):
+                options = dict(pwordcount.DEFAULT_OPTIONS, top=top, min_count=min_count)
+                expected = pwordcount.select_occurrences(pwordcount.unpack_vocabulary(vocabulary), options)
+                selection = [(word.decode('utf-8', errors='replace'), occurences)
+                             for word, occurences in pwordcount.select_packed(vocabulary, options)]
+                self.assertEqual(selection, expected)
+
+
+class WorkerTest(unittest.TestCase):
+    """
+    Dispatches the tasks of a run to worker daemons, one of which drops its connection.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.text = write_text(self.directory, 50000)
+        environ = mock.patch.dict(os.environ, {pwordcount.AUTHKEY_VARIABLE: "secret"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.received = threading.Event()
+
+    def listen(self, name: str, serve) -> str:
+        # Serves the first coordinator that connects in a thread of its own
+        address = os.path.join(self.directory, name)
+        listener = Listener(address, authkey=b"secret")
+        self.addCleanup(listener.close)
+
+        def accept():
+            with listener.accept() as connection:
+                serve(connection)
+
+        thread = threading.Thread(target=accept, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 10)
+        return address
+
+    def drop(self, connection):
+        # Takes a task and disconnects without a result
+        connection.send(("hello", None, 1))
+        connection.recv()
+        self.received.set()
+
+    def serve(self, connection):
+        with ThreadPool(2) as pool:
+            pwordcount.serve_coordinator(connection, pool, 2)
+
+    def test_retry_after_disconnect(self):
+        expected = pwordcount.count(self.text, "tuo")
+        # The dropping worker is connected first and takes the first task
+        workers = (self.listen("drop.sock", self.drop), self.listen("worker.sock", self.serve))
+        with mock.patch.object(pwordcount, "SPLIT_THRESHOLD", 16384), mock.patch("sys.stderr") as stderr:
+            result = pwordcount.count(self.text, "tuo", workers=workers)
+        self.assertTrue(self.received.is_set())
+        self.assertIn("disconnected", "".join(str(call) for call in stderr.write.call_args_list))
+        self.assertGreater(result.parts, 1)
+        self.assertEqual(result.total, expected.total)
+        self.assertEqual(result.unique_count(), expected.unique_count())
+        self.assertEqual(result.word_counts(), expected.word_counts())
+
+    def test_no_worker_left(self):
+        workers = (self.listen("drop.sock", self.drop),)
+        with self.assertRaises(pwordcount.WorkerError), mock.patch("sys.stderr"):
+            pwordcount.count(self.text, "t", workers=workers)
+
+
+if __name__ == "__main__":
+    unittest.main()